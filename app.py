@@ -1,9 +1,28 @@
 import streamlit as st
-from datetime import datetime
+from datetime import datetime, timedelta
 import pandas as pd
 import os
-import uuid
-import requests  # ใช้สำหรับส่ง LINE Notify (ถ้าตั้ง token ไว้)
+import sqlite3
+import threading
+import functools
+import glob
+import hashlib
+import html
+import io
+import json
+import tempfile
+from contextlib import contextmanager
+import queue
+import time
+import zipfile
+from itertools import groupby
+from string import Template
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image, ImageOps
+import requests  # ใช้สำหรับส่งแจ้งเตือน LINE / webhook (ถ้าตั้งค่าไว้)
+from requests.adapters import HTTPAdapter
+
+RERUN_STARTED = time.perf_counter()   # เวลาเริ่ม rerun รอบนี้ (ใช้วัดเวลา rerun)
 
 # ---------------- CONFIG ----------------
 st.set_page_config(
@@ -25,37 +44,284 @@ page_bg = """
 """
 st.markdown(page_bg, unsafe_allow_html=True)
 
-ORDERS_FILE = "orders.csv"
+ORDERS_FILE = "orders.csv"   # ไฟล์ออเดอร์แบบเก่า (ย้ายเข้า DB อัตโนมัติครั้งแรก)
+ORDERS_DB = "orders.db"
 SLIPS_DIR = "slips"
-os.makedirs(SLIPS_DIR, exist_ok=True)
+SLIP_THUMBS_DIR = os.path.join(SLIPS_DIR, "thumbs")
+SLIPS_ARCHIVE_DIR = os.path.join(SLIPS_DIR, "archive")    # สลิปเก่าแยกโฟลเดอร์ตามปี/เดือน
+ORDERS_ARCHIVE_DIR = os.path.join("archive", "orders")   # ออเดอร์เก่าเป็น Parquet รายเดือน
+os.makedirs(SLIP_THUMBS_DIR, exist_ok=True)
+
+# เก็บออเดอร์ที่ปิดแล้วไว้ใน DB กี่วัน ก่อนย้ายเข้าคลัง (สั่งจากหน้า Admin)
+RETENTION_DAYS = 90
+
+# สลิป: ย่อรูปก่อนเก็บ + ทำ thumbnail สำหรับหน้า Admin
+SLIP_UPLOAD_LIMIT = 15 * 1024 * 1024   # ไฟล์อัปโหลดใหญ่สุด (ไบต์)
+SLIP_CHUNK_SIZE = 64 * 1024
+SLIP_MAX_SIDE = 1600                   # ด้านยาวสุดของรูปที่เก็บ (px)
+SLIP_THUMB_SIDE = 320
+SLIP_JPEG_QUALITY = 80
+
+# QR ชำระเงิน: หาไฟล์ + บีบอัดครั้งเดียวตอนเริ่มแอป
+QR_FILES = ["qr_matcha.jpeg", "qr_matcha.jpg", "qr_matcha.png"]
+QR_MAX_SIDE = 800
 
 # ค่าจัดส่งคงที่
 DELIVERY_FEE = 5
 
 # เมนูมัจฉะ + เครื่องดื่มอื่น ๆ (เย็นทั้งหมด)
-MENU_ITEMS = {
-    "(ใส่แก้วแยกน้ำแข็ง)   matcha oat milk เย็น 60 บาท": 60,
-    "(ใส่แก้วแยกน้ำแข็ง)   matcha fresh milk เย็น 60 บาท": 60,
-    "(ใส่แก้วแยกน้ำแข็ง)   coconut matcha เย็น 60 บาท": 60,
-    "(ใส่แก้วแยกน้ำแข็ง)   ชาไทยเย็น 40 บาท": 40,
-    "(ใส่แก้วแยกน้ำแข็ง)   ชาเขียวเย็น 40 บาท": 40,
-    "(ใส่แก้วแยกน้ำแข็ง)   โกโก้เย็น 50 บาท": 50,
-    "(ใส่แก้วแยกน้ำแข็ง)   โอวัลตินเย็น 40 บาท": 40,
-    "(ใส่แก้วแยกน้ำแข็ง)   es-yen 50 บาท": 50,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   matcha oat milk เย็น 55 บาท": 55,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   matcha fresh milk เย็น 55 บาท": 55,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   coconut matcha เย็น 55 บาท": 55,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   ชาไทยเย็น 35 บาท": 35,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   ชาเขียวเย็น 35 บาท": 35,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   โกโก้เย็น 45 บาท": 45,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   โอวัลตินเย็น 35 บาท": 35,
-    "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)   es-yen 45 บาท": 45,
+# ออเดอร์เก็บแค่ item_id สั้น ๆ ชื่อเต็มสำหรับแสดงผลสร้างจาก container + drink + price
+MENU_CONTAINERS = {
+    "cup": "(ใส่แก้วแยกน้ำแข็ง)",
+    "bottle": "(ใส่ขวด ไม่มีมีแก้วและน้ำแข็ง)",
 }
 
+MENU_CATALOG = [
+    {"item_id": "matcha-oat-cup", "drink": "matcha oat milk เย็น", "container": "cup", "price": 60, "available": True},
+    {"item_id": "matcha-fresh-cup", "drink": "matcha fresh milk เย็น", "container": "cup", "price": 60, "available": True},
+    {"item_id": "coconut-matcha-cup", "drink": "coconut matcha เย็น", "container": "cup", "price": 60, "available": True},
+    {"item_id": "thai-tea-cup", "drink": "ชาไทยเย็น", "container": "cup", "price": 40, "available": True},
+    {"item_id": "green-tea-cup", "drink": "ชาเขียวเย็น", "container": "cup", "price": 40, "available": True},
+    {"item_id": "cocoa-cup", "drink": "โกโก้เย็น", "container": "cup", "price": 50, "available": True},
+    {"item_id": "ovaltine-cup", "drink": "โอวัลตินเย็น", "container": "cup", "price": 40, "available": True},
+    {"item_id": "es-yen-cup", "drink": "es-yen", "container": "cup", "price": 50, "available": True},
+    {"item_id": "matcha-oat-bottle", "drink": "matcha oat milk เย็น", "container": "bottle", "price": 55, "available": True},
+    {"item_id": "matcha-fresh-bottle", "drink": "matcha fresh milk เย็น", "container": "bottle", "price": 55, "available": True},
+    {"item_id": "coconut-matcha-bottle", "drink": "coconut matcha เย็น", "container": "bottle", "price": 55, "available": True},
+    {"item_id": "thai-tea-bottle", "drink": "ชาไทยเย็น", "container": "bottle", "price": 35, "available": True},
+    {"item_id": "green-tea-bottle", "drink": "ชาเขียวเย็น", "container": "bottle", "price": 35, "available": True},
+    {"item_id": "cocoa-bottle", "drink": "โกโก้เย็น", "container": "bottle", "price": 45, "available": True},
+    {"item_id": "ovaltine-bottle", "drink": "โอวัลตินเย็น", "container": "bottle", "price": 35, "available": True},
+    {"item_id": "es-yen-bottle", "drink": "es-yen", "container": "bottle", "price": 45, "available": True},
+]
+
 SWEETNESS_LEVEL = ["หวานน้อย", "หวานปกติ", "หวานมาก"]
 
-# LINE Notify token (ตั้งใน Streamlit secrets ถ้ามี)
-LINE_NOTIFY_TOKEN = st.secrets.get("LINE_NOTIFY_TOKEN", "")
+# สถานะออเดอร์: รับออเดอร์ → กำลังทำ → พร้อมรับ → ลูกค้ารับแล้ว
+ORDER_STATUS_LABELS = {
+    "received": "รับออเดอร์แล้ว",
+    "making": "กำลังทำ",
+    "ready": "พร้อมรับ",
+    "picked_up": "ลูกค้ารับแล้ว",
+}
+ORDER_STATUS_NEXT = {
+    "received": ("making", "▶️ เริ่มทำ"),
+    "making": ("ready", "✅ ทำเสร็จแล้ว"),
+    "ready": ("picked_up", "🙌 ลูกค้ารับแล้ว"),
+}
+OPEN_ORDER_STATUSES = list(ORDER_STATUS_NEXT)
+BARISTA_REFRESH_INTERVAL = 5
+
+# จำนวนแถวต่อหน้าในตารางออเดอร์ของ Admin
+ORDER_PAGE_SIZES = [25, 50, 100]
+
+# ฟีดออเดอร์สดในหน้า Admin / การเช็คสถานะร้านฝั่งลูกค้า (วินาที)
+ORDER_FEED_INTERVAL = 5
+ORDER_FEED_SIZE = 10
+SHOP_WATCH_INTERVAL = 10
+
+# จำนวนตัวเลือกสูงสุดใน selectbox ของ Admin (กันโหลดหลักหมื่นรายการ)
+MAX_ORDER_OPTIONS = 200
+
+# ออเดอร์ใน cache เก็บเป็นก้อน ๆ: แถวใหม่ต่อท้ายแค่ก้อนสุดท้าย ไม่ต้อง copy ทั้งตาราง
+ORDER_CACHE_CHUNK = 4096
+
+
+
+def get_secret(key: str, default=""):
+    """อ่านค่าจาก Streamlit secrets (ไม่มีไฟล์ secrets ก็คืนค่า default)"""
+    try:
+        return st.secrets.get(key, default)
+    except FileNotFoundError:
+        return default
+
+
+# รหัสผ่านหน้า Admin / บาริสต้า
+ADMIN_PASSWORD = get_secret("ADMIN_PASSWORD", "goggag1112")
+
+# การแจ้งเตือนออเดอร์ใหม่ (LINE Notify ปิดบริการแล้ว → ใช้ LINE Messaging API / webhook)
+# NOTIFY_BACKEND: "line" | "webhook" | "stub" (ไม่ตั้ง = เลือกเองจาก secrets ที่มี)
+NOTIFY_BACKEND = get_secret("NOTIFY_BACKEND", "")
+LINE_CHANNEL_ACCESS_TOKEN = get_secret("LINE_CHANNEL_ACCESS_TOKEN", "")
+LINE_TO = get_secret("LINE_TO", "")   # userId / groupId ที่จะรับข้อความ
+NOTIFY_WEBHOOK_URL = get_secret("NOTIFY_WEBHOOK_URL", "")
+NOTIFY_STUB_FILE = "notifications.log"
+
+NOTIFY_QUEUE_SIZE = 1000
+NOTIFY_MAX_ATTEMPTS = 8
+NOTIFY_RETRY_BASE = 2      # วินาที: 2, 4, 8, ... (ไม่เกิน NOTIFY_RETRY_MAX)
+NOTIFY_RETRY_MAX = 300
+NOTIFY_SWEEP_INTERVAL = 2  # วินาที: รอบเช็ค outbox ที่ถึงเวลาส่งซ้ำ
+NOTIFY_PRUNE_INTERVAL = 3600   # วินาที: รอบลบข้อความที่ส่งแล้วออกจาก outbox
+NOTIFY_SENT_KEEP_DAYS = 7      # ข้อความที่ส่งสำเร็จเก็บไว้ดูย้อนหลังกี่วัน
+
+# วัดเวลา hot path (ปิดได้ด้วย METRICS_ENABLED = "false" → ไม่ห่อฟังก์ชันเลย)
+METRICS_ENABLED = str(get_secret("METRICS_ENABLED", "true")).lower() not in ("0", "false", "no")
+METRICS_PORT = int(get_secret("METRICS_PORT", 0))   # > 0 = เปิด http://host:PORT/metrics
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)   # วินาที
+
+
+# ---------------- METRICS ----------------
+# registry เดียวต่อ process: เวลา (histogram), ตัวนับ error, และ gauge ที่อ่านค่าตอน export
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}   # (name, labels) → {"buckets": [...], "count", "sum", "max"}
+        self.counters = {}  # (name, labels) → จำนวน
+        self.gauges = {}    # name → ฟังก์ชันคืนค่าปัจจุบัน
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = {
+                    "buckets": [0] * len(METRICS_BUCKETS), "count": 0, "sum": 0.0, "max": 0.0,
+                }
+            for i, bound in enumerate(METRICS_BUCKETS):
+                if seconds <= bound:
+                    timing["buckets"][i] += 1
+                    break
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def register_gauge(self, name: str, func):
+        with self.lock:
+            self.gauges[name] = func
+
+    def read_gauges(self) -> dict:
+        with self.lock:
+            gauges = dict(self.gauges)
+        values = {}
+        for name, func in gauges.items():
+            try:
+                values[name] = func()
+            except Exception:
+                values[name] = None
+        return values
+
+    def snapshot(self):
+        with self.lock:
+            timings = {key: {**t, "buckets": list(t["buckets"])} for key, t in self.timings.items()}
+            counters = dict(self.counters)
+        return timings, counters, self.read_gauges()
+
+    def prometheus_text(self) -> str:
+        """export ในรูปแบบ text ของ Prometheus (ชื่อขึ้นต้นด้วย matcha_)"""
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pairs) + "}"
+
+        timings, counters, gauges = self.snapshot()
+        lines = []
+        for name in sorted({name for name, _ in timings}):
+            metric = f"matcha_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (t_name, labels), timing in sorted(timings.items()):
+                if t_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(METRICS_BUCKETS, timing["buckets"]):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric}_bucket{fmt_labels(labels, [('le', '+Inf')])} {timing['count']}")
+                lines.append(f"{metric}_sum{fmt_labels(labels)} {timing['sum']:.6f}")
+                lines.append(f"{metric}_count{fmt_labels(labels)} {timing['count']}")
+        for name in sorted({name for name, _ in counters}):
+            metric = f"matcha_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (c_name, labels), value in sorted(counters.items()):
+                if c_name == name:
+                    lines.append(f"{metric}{fmt_labels(labels)} {value}")
+        for name, value in sorted(gauges.items()):
+            if value is None:
+                continue
+            lines.append(f"# TYPE matcha_{name} gauge")
+            lines.append(f"matcha_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+@st.cache_resource
+def get_metrics() -> MetricsRegistry:
+    return MetricsRegistry()
+
+
+def timed(name: str):
+    """decorator วัดเวลาฟังก์ชัน + นับ error (ถ้าปิด metrics คืนฟังก์ชันเดิม ไม่มี overhead)"""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                get_metrics().inc("errors", op=name)
+                raise
+            finally:
+                get_metrics().observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def register_gauge(name: str, func):
+    if METRICS_ENABLED:
+        get_metrics().register_gauge(name, func)
+
+
+def finish_rerun():
+    """บันทึกเวลา rerun รอบนี้ แยกตามโหมดที่เลือก"""
+    if METRICS_ENABLED:
+        get_metrics().observe("rerun", time.perf_counter() - RERUN_STARTED, mode=mode)
+
+
+def stop_rerun():
+    """ใช้แทน st.stop() ในหน้าหลัก เพื่อให้ rerun ที่จบกลางทางถูกนับเวลาด้วย"""
+    finish_rerun()
+    st.stop()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass   # ไม่ต้อง log ทุกครั้งที่ Prometheus มาดึง
+
+
+@st.cache_resource
+def start_metrics_server():
+    """เปิด endpoint /metrics ครั้งเดียวต่อ process (เฉพาะเมื่อตั้ง METRICS_PORT)
+
+    พอร์ตถูกใช้อยู่ (เช่น Streamlit อีก process) → ข้ามไป คืน None ให้แอปทำงานต่อได้
+    """
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        print(f"metrics server: เปิดพอร์ต {METRICS_PORT} ไม่ได้:", e)
+        return None
+    server.daemon_threads = True
+    server.registry = get_metrics()
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
 
 
 # ---------------- HELPERS ----------------
@@ -63,45 +329,1882 @@ def go_to_step(step_number: int):
     st.session_state.step = step_number
 
 
+def start_new_order():
+    st.session_state.step = 1
+    st.session_state.customer = {}
+    st.session_state.order = {}
+    st.session_state.cart = []
+    st.session_state.pop("placed_order", None)
+
+
+@st.cache_resource
+def load_menu_catalog() -> dict:
+    """item_id → รายการเมนู (พร้อม label ชื่อเต็ม) สร้างครั้งเดียวต่อ process"""
+    catalog = {}
+    for item in MENU_CATALOG:
+        label = f"{MENU_CONTAINERS[item['container']]}   {item['drink']} {item['price']} บาท"
+        catalog[item["item_id"]] = {**item, "label": label}
+    return catalog
+
+
+def menu_label(item_id: str) -> str:
+    item = load_menu_catalog().get(item_id)
+    return item["label"] if item else str(item_id)
+
+
+def menu_labels(menu) -> str:
+    """คอลัมน์ menu ของ orders (item_id หลายแก้วคั่นด้วย " + ") → ชื่อเมนูที่อ่านได้"""
+    if not isinstance(menu, str):
+        return menu
+    return " + ".join(menu_label(part) for part in menu.split(" + "))
+
+
+def legacy_menu_ids() -> dict:
+    """ชื่อเมนูเต็มแบบเก่า (ที่เคยเก็บใน orders.csv) → item_id"""
+    return {item["label"]: item_id for item_id, item in load_menu_catalog().items()}
+
+
+def add_to_cart():
+    """เพิ่มเครื่องดื่มที่เลือกอยู่ลงตะกร้า แล้วล้างช่องโน้ตรอแก้วถัดไป"""
+    item = load_menu_catalog()[st.session_state.cart_menu]
+    st.session_state.cart.append({
+        "item_id": item["item_id"],
+        "menu": item["label"],
+        "sweetness": st.session_state.cart_sweetness,
+        "note": st.session_state.cart_note.strip(),
+        "price": item["price"],
+    })
+    st.session_state.cart_note = ""
+
+
+def remove_from_cart(index: int):
+    if 0 <= index < len(st.session_state.cart):
+        st.session_state.cart.pop(index)
+
+
+# ---------------- ORDER IDS ----------------
+# order_id แบบ ULID: เวลา (ms) 48 บิต + สุ่ม 80 บิต → 26 ตัวอักษร เรียงตามเวลาได้
+# กดยืนยันซ้ำในวินาทีเดียวกันก็ไม่ชน (เดิมใช้ ชื่อ-เบอร์-เวลา ระดับวินาที)
+# ลูกค้า/บาริสต้าใช้เลขคิวรายวันสั้น ๆ (#001, #002, ...) แทน
+ORDER_ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"   # Crockford base32
+
+
+class OrderIdGenerator:
+    """สร้าง ULID แบบ monotonic: ms เดียวกันจะบวกส่วนสุ่มทีละ 1 ให้ยังเรียงต่อกัน"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_ms = 0
+        self.last_rand = 0
+
+    def new(self, ms=None) -> str:
+        with self.lock:
+            ms = int(time.time() * 1000) if ms is None else int(ms)
+            if ms <= self.last_ms:
+                # ms เดียวกัน (หรือนาฬิกาถอยหลัง) → ใช้เวลาเดิมต่อ
+                ms, rand = self.last_ms, self.last_rand + 1
+                if rand >= 1 << 80:
+                    ms, rand = ms + 1, int.from_bytes(os.urandom(10), "big")
+            else:
+                rand = int.from_bytes(os.urandom(10), "big")
+            self.last_ms, self.last_rand = ms, rand
+        value = (ms << 80) | rand
+        return "".join(ORDER_ID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+@st.cache_resource
+def get_order_id_generator() -> OrderIdGenerator:
+    return OrderIdGenerator()
+
+
+def new_order_id() -> str:
+    return get_order_id_generator().new()
+
+
+def created_at_ms(created_at) -> int:
+    """เวลาใน created_at (YYYY-MM-DD HH:MM:SS) เป็น ms ใช้ตอนแปลงออเดอร์เก่า (อ่านไม่ได้คืน 0)"""
+    try:
+        return int(datetime.strptime(str(created_at)[:19], "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
+    except ValueError:
+        return 0
+
+
+def next_pickup_no(conn, day: str) -> int:
+    """เลขคิวถัดไปของวันนั้น (เรียกใน transaction เดียวกับ insert ออเดอร์)"""
+    return conn.execute(
+        "INSERT INTO pickup_counters (day, last_no) VALUES (?, 1) "
+        "ON CONFLICT(day) DO UPDATE SET last_no = last_no + 1 RETURNING last_no",
+        (day,),
+    ).fetchone()[0]
+
+
+def pickup_label(pickup_no) -> str:
+    if pickup_no is None or pd.isna(pickup_no) or pickup_no == "":
+        return "-"
+    return f"#{int(pickup_no):03d}"
+
+
+# ---------------- ORDER STORE ----------------
+# เก็บออเดอร์ใน SQLite (WAL) แทนการอ่าน CSV ทั้งไฟล์แล้วเขียนทับทุกครั้ง
+# เขียนแบบ append ทีละแถว → เวลา confirm คงที่แม้มีออเดอร์เป็นแสน
+ORDER_COLUMNS = [
+    "order_id", "created_at", "name", "phone", "menu", "sweetness", "note",
+    "price", "delivery_fee", "total_price", "slip_file", "status", "pickup_no", "legacy_id",
+]
+ORDER_INT_COLUMNS = ["price", "delivery_fee", "total_price"]
+ORDER_DEFAULTS = {"status": "received"}
+LEGACY_ORDER_STATUS = "picked_up"   # ออเดอร์จากก่อนมีสถานะ ถือว่าลูกค้ารับไปแล้ว
+
+ORDERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id     TEXT NOT NULL,
+    created_at   TEXT NOT NULL,
+    name         TEXT,
+    phone        TEXT,
+    menu         TEXT,
+    sweetness    TEXT,
+    note         TEXT,
+    price        INTEGER,
+    delivery_fee INTEGER,
+    total_price  INTEGER,
+    slip_file    TEXT,
+    status       TEXT NOT NULL DEFAULT 'received',
+    pickup_no    INTEGER,
+    legacy_id    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_slip_file ON orders(slip_file);
+
+-- รายการเครื่องดื่มในแต่ละออเดอร์ (1 ออเดอร์มีได้หลายแก้ว)
+CREATE TABLE IF NOT EXISTS order_items (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_pk  INTEGER NOT NULL REFERENCES orders(id),
+    line_no   INTEGER NOT NULL,
+    item_id   TEXT,
+    menu      TEXT,
+    sweetness TEXT,
+    note      TEXT,
+    price     INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_pk ON order_items(order_pk);
+CREATE INDEX IF NOT EXISTS idx_order_items_menu ON order_items(menu);
+
+-- เลขคิวล่าสุดของแต่ละวัน
+CREATE TABLE IF NOT EXISTS pickup_counters (
+    day     TEXT PRIMARY KEY,
+    last_no INTEGER NOT NULL
+);
+
+-- ประวัติการย้ายออเดอร์เก่าเข้าคลัง (cutoff ล่าสุด = วันที่ก่อนหน้านั้นไม่อยู่ใน DB แล้ว)
+CREATE TABLE IF NOT EXISTS archive_runs (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    ran_at          TEXT NOT NULL,
+    cutoff          TEXT NOT NULL,
+    orders          INTEGER NOT NULL,
+    slips           INTEGER NOT NULL,
+    reclaimed_bytes INTEGER NOT NULL
+);
+"""
+ORDER_ITEM_COLUMNS = ["item_id", "menu", "sweetness", "note", "price"]
+
+# คอลัมน์ที่เพิ่มทีหลัง (DB ใหม่ได้จาก CREATE TABLE แล้ว) DB เก่าจะถูก ALTER TABLE ให้ตอนเปิด
+ORDERS_ADDED_COLUMNS = {
+    "status": "TEXT NOT NULL DEFAULT 'received'",
+    "pickup_no": "INTEGER",
+    "legacy_id": "TEXT",   # order_id แบบเก่า (ชื่อ-เบอร์-เวลา) เก็บไว้ค้นหาย้อนหลัง
+}
+ORDER_ITEMS_ADDED_COLUMNS = {
+    "item_id": "TEXT",
+}
+
+
+def run_schema(conn, script: str):
+    """รันทีละคำสั่งแทน executescript (ซึ่งจะ COMMIT transaction ที่เปิดอยู่ทิ้ง)"""
+    for statement in script.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def ensure_columns(conn, table: str, columns: dict):
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for column, decl in columns.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+class OrderStore:
+    """connection เดียวต่อ process + lock กันหลาย session เขียนชนกัน"""
+
+    def __init__(self, path: str):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+
+    def ensure_schema(self, conn):
+        """สร้าง/อัปเกรดตาราง (เรียกใน transaction เดียวกับ migration ใน get_order_store)"""
+        run_schema(conn, ORDERS_SCHEMA)
+        ensure_columns(conn, "orders", ORDERS_ADDED_COLUMNS)
+        ensure_columns(conn, "order_items", ORDER_ITEMS_ADDED_COLUMNS)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_order_items_item_id ON order_items(item_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_legacy_id ON orders(legacy_id)")
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            if self.conn.in_transaction:
+                # ซ้อนอยู่ใน transaction ที่เปิดไว้แล้ว (เช่นตอน migration) → ใช้ของเดิม
+                yield self.conn
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def read_df(self, sql: str, params=()):
+        with self.lock:
+            return pd.read_sql_query(sql, self.conn, params=params)
+
+
+def migrate_csv_orders(store: OrderStore):
+    """ย้ายออเดอร์จาก orders.csv เดิมเข้า DB ครั้งเดียว แล้วเปลี่ยนชื่อไฟล์เก่าเก็บไว้"""
+    if not os.path.exists(ORDERS_FILE):
+        return
+    # อ่านเป็น str ทั้งหมด กันเบอร์โทรที่ขึ้นต้นด้วย 0 หาย
+    df = pd.read_csv(ORDERS_FILE, dtype=str, keep_default_na=False)
+    if "status" not in df.columns:
+        df["status"] = LEGACY_ORDER_STATUS
+    for col in ORDER_COLUMNS:
+        if col not in df.columns:
+            df[col] = ORDER_DEFAULTS.get(col, "")
+    for col in ORDER_INT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
+    # id เดิมใน CSV ซ้ำกันได้ → เก็บเป็น alias แล้วออก ULID ใหม่ตามเวลาออเดอร์
+    generator = OrderIdGenerator()
+    df["legacy_id"] = df["order_id"]
+    df["order_id"] = [generator.new(created_at_ms(c)) for c in df["created_at"]]
+    df["pickup_no"] = None
+    rows = df[ORDER_COLUMNS].values.tolist()
+    placeholders = ", ".join("?" for _ in ORDER_COLUMNS)
+    with store.transaction() as conn:
+        conn.executemany(
+            f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) VALUES ({placeholders})",
+            rows,
+        )
+    os.replace(ORDERS_FILE, ORDERS_FILE + ".migrated")
+
+
+def backfill_order_items(store: OrderStore):
+    """ออเดอร์แบบเก่า (แก้วเดียว ไม่มี order_items) → สร้างรายการจากคอลัมน์ใน orders"""
+    with store.transaction() as conn:
+        conn.execute(
+            "INSERT INTO order_items (order_pk, line_no, menu, sweetness, note, price) "
+            "SELECT o.id, 1, o.menu, o.sweetness, o.note, o.price FROM orders o "
+            "WHERE NOT EXISTS (SELECT 1 FROM order_items i WHERE i.order_pk = o.id)"
+        )
+
+
+def migrate_order_status(store: OrderStore):
+    """ครั้งเดียว: ออเดอร์ก่อนมีสถานะได้ 'received' จาก DEFAULT ของคอลัมน์ → ปิดให้เป็น picked_up
+
+    ใช้ PRAGMA user_version จำว่าทำแล้ว · ออเดอร์ของวันนี้ยังไม่แตะ เผื่อยังอยู่ในคิวจริง
+    """
+    with store.transaction() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+            return
+        conn.execute(
+            "UPDATE orders SET status = ? WHERE status = 'received' AND created_at < ?",
+            (LEGACY_ORDER_STATUS, datetime.now().strftime("%Y-%m-%d")),
+        )
+        conn.execute("PRAGMA user_version = 1")
+
+
+def migrate_order_ids(store: OrderStore):
+    """แปลง order_id แบบเก่าเป็น ULID (id เก่าย้ายไป legacy_id), ใส่เลขคิวย้อนหลัง แล้วทำ index แบบ unique"""
+    with store.transaction() as conn:
+        rows = conn.execute(
+            "SELECT id, order_id, created_at FROM orders "
+            "WHERE legacy_id IS NULL AND (length(order_id) != 26 OR order_id GLOB '*[^0-9A-Z]*') "
+            "ORDER BY id"
+        ).fetchall()
+        generator = OrderIdGenerator()
+        conn.executemany(
+            "UPDATE orders SET legacy_id = order_id, order_id = ? WHERE id = ?",
+            [(generator.new(created_at_ms(created_at)), pk) for pk, _, created_at in rows],
+        )
+        conn.execute("DROP INDEX IF EXISTS idx_orders_order_id")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_order_id_unique ON orders(order_id)")
+
+        if conn.execute("SELECT 1 FROM orders WHERE pickup_no IS NULL LIMIT 1").fetchone():
+            # เลขคิวย้อนหลัง: เรียงตามลำดับที่เข้ามาในแต่ละวัน ต่อจากเลขที่ออกไปแล้ว
+            conn.execute(
+                "UPDATE orders SET pickup_no = q.no FROM ("
+                "  SELECT o.id, COALESCE(c.last_no, 0) + ROW_NUMBER() OVER ("
+                "    PARTITION BY substr(o.created_at, 1, 10) ORDER BY o.id) AS no "
+                "  FROM orders o LEFT JOIN pickup_counters c ON c.day = substr(o.created_at, 1, 10) "
+                "  WHERE o.pickup_no IS NULL"
+                ") q WHERE orders.id = q.id"
+            )
+            conn.execute(
+                "INSERT INTO pickup_counters (day, last_no) "
+                "SELECT substr(created_at, 1, 10), MAX(pickup_no) FROM orders WHERE true GROUP BY 1 "
+                "ON CONFLICT(day) DO UPDATE SET last_no = MAX(last_no, excluded.last_no)"
+            )
+
+
+def migrate_menu_ids(store: OrderStore):
+    """แปลงชื่อเมนูเต็มในออเดอร์เก่าเป็น item_id (แถวที่แปลงแล้วจะไม่ถูกแตะซ้ำ)"""
+    with store.transaction() as conn:
+        conn.executemany(
+            "UPDATE order_items SET item_id = ? WHERE item_id IS NULL AND menu = ?",
+            [(item_id, label) for label, item_id in legacy_menu_ids().items()],
+        )
+        # สรุปเมนูใน orders ให้เป็น item_id แบบเดียวกับออเดอร์ใหม่
+        conn.execute(
+            "UPDATE orders SET menu = ("
+            "  SELECT group_concat(COALESCE(item_id, menu), ' + ') FROM ("
+            "    SELECT item_id, menu FROM order_items WHERE order_pk = orders.id ORDER BY line_no"
+            "  )"
+            ") WHERE id IN ("
+            "  SELECT order_pk FROM order_items WHERE menu IS NOT NULL AND item_id IS NOT NULL"
+            ")"
+        )
+        conn.execute(
+            "UPDATE order_items SET menu = NULL WHERE menu IS NOT NULL AND item_id IS NOT NULL"
+        )
+
+
+# ---------------- SALES ROLLUPS ----------------
+# ยอดขายสรุปรายวัน / รายชั่วโมง / รายเมนู / ความหวาน อัปเดตทีละออเดอร์ตอน save_order
+# หน้า dashboard อ่านแค่ตารางสรุปเล็ก ๆ ไม่ต้องสแกนออเดอร์ทั้งหมด
+ROLLUPS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales_daily (
+    day          TEXT PRIMARY KEY,
+    orders       INTEGER NOT NULL DEFAULT 0,
+    drinks       INTEGER NOT NULL DEFAULT 0,
+    revenue      INTEGER NOT NULL DEFAULT 0,
+    delivery_fee INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sales_hourly (
+    day     TEXT NOT NULL,
+    hour    INTEGER NOT NULL,
+    orders  INTEGER NOT NULL DEFAULT 0,
+    revenue INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, hour)
+);
+CREATE TABLE IF NOT EXISTS sales_daily_menu (
+    day     TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    qty     INTEGER NOT NULL DEFAULT 0,
+    revenue INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, item_id)
+);
+CREATE TABLE IF NOT EXISTS sales_daily_sweetness (
+    day       TEXT NOT NULL,
+    sweetness TEXT NOT NULL,
+    qty       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, sweetness)
+);
+"""
+
+
+def update_rollups(conn, order_data: dict, items):
+    """บวกยอดของออเดอร์ใหม่ 1 รายการเข้าตารางสรุป (เรียกใน transaction เดียวกับ insert)"""
+    created_at = str(order_data["created_at"])
+    day, hour = created_at[:10], int(created_at[11:13] or 0)
+    revenue = int(order_data.get("total_price") or 0)
+    conn.execute(
+        "INSERT INTO sales_daily (day, orders, drinks, revenue, delivery_fee) VALUES (?, 1, ?, ?, ?) "
+        "ON CONFLICT(day) DO UPDATE SET orders = orders + 1, drinks = drinks + excluded.drinks, "
+        "revenue = revenue + excluded.revenue, delivery_fee = delivery_fee + excluded.delivery_fee",
+        (day, len(items), revenue, int(order_data.get("delivery_fee") or 0)),
+    )
+    conn.execute(
+        "INSERT INTO sales_hourly (day, hour, orders, revenue) VALUES (?, ?, 1, ?) "
+        "ON CONFLICT(day, hour) DO UPDATE SET orders = orders + 1, revenue = revenue + excluded.revenue",
+        (day, hour, revenue),
+    )
+    conn.executemany(
+        "INSERT INTO sales_daily_menu (day, item_id, qty, revenue) VALUES (?, ?, 1, ?) "
+        "ON CONFLICT(day, item_id) DO UPDATE SET qty = qty + 1, revenue = revenue + excluded.revenue",
+        [(day, item.get("item_id") or item["menu"], int(item["price"] or 0)) for item in items],
+    )
+    conn.executemany(
+        "INSERT INTO sales_daily_sweetness (day, sweetness, qty) VALUES (?, ?, 1) "
+        "ON CONFLICT(day, sweetness) DO UPDATE SET qty = qty + 1",
+        [(day, item["sweetness"] or "-") for item in items],
+    )
+
+
+def rebuild_rollups(store: OrderStore):
+    """คำนวณตารางสรุปใหม่จากออเดอร์ (ใช้ครั้งแรก หรือเมื่อสั่งจากหน้า Admin)
+
+    วันที่ก่อน cutoff ของการย้ายเข้าคลังครั้งล่าสุดไม่อยู่ใน DB แล้ว → เก็บยอดสรุปเดิมไว้
+    """
+    with store.transaction() as conn:
+        since = conn.execute("SELECT COALESCE(MAX(cutoff), '') FROM archive_runs").fetchone()[0]
+        for table in ("sales_daily", "sales_hourly", "sales_daily_menu", "sales_daily_sweetness"):
+            conn.execute(f"DELETE FROM {table} WHERE day >= ?", (since,))
+        conn.execute(
+            "INSERT INTO sales_daily (day, orders, drinks, revenue, delivery_fee) "
+            "SELECT substr(o.created_at, 1, 10), COUNT(*), "
+            "  SUM((SELECT COUNT(*) FROM order_items i WHERE i.order_pk = o.id)), "
+            "  SUM(COALESCE(o.total_price, 0)), SUM(COALESCE(o.delivery_fee, 0)) "
+            "FROM orders o WHERE o.created_at >= ? GROUP BY 1",
+            (since,),
+        )
+        conn.execute(
+            "INSERT INTO sales_hourly (day, hour, orders, revenue) "
+            "SELECT substr(created_at, 1, 10), CAST(substr(created_at, 12, 2) AS INTEGER), "
+            "  COUNT(*), SUM(COALESCE(total_price, 0)) "
+            "FROM orders WHERE created_at >= ? GROUP BY 1, 2",
+            (since,),
+        )
+        conn.execute(
+            "INSERT INTO sales_daily_menu (day, item_id, qty, revenue) "
+            "SELECT substr(o.created_at, 1, 10), COALESCE(i.item_id, i.menu, '-'), "
+            "  COUNT(*), SUM(COALESCE(i.price, 0)) "
+            "FROM order_items i JOIN orders o ON o.id = i.order_pk WHERE o.created_at >= ? GROUP BY 1, 2",
+            (since,),
+        )
+        conn.execute(
+            "INSERT INTO sales_daily_sweetness (day, sweetness, qty) "
+            "SELECT substr(o.created_at, 1, 10), COALESCE(NULLIF(i.sweetness, ''), '-'), COUNT(*) "
+            "FROM order_items i JOIN orders o ON o.id = i.order_pk WHERE o.created_at >= ? GROUP BY 1, 2",
+            (since,),
+        )
+
+
+def ensure_rollups(store: OrderStore):
+    with store.lock:
+        run_schema(store.conn, ROLLUPS_SCHEMA)
+        empty = store.conn.execute("SELECT 1 FROM sales_daily LIMIT 1").fetchone() is None
+        has_orders = store.conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone() is not None
+    if empty and has_orders:
+        rebuild_rollups(store)
+
+
+@st.cache_resource
+def get_order_store() -> OrderStore:
+    store = OrderStore(ORDERS_DB)
+    # สร้างตาราง + migration ทั้งหมดใน BEGIN IMMEDIATE เดียว: หลาย process เปิดพร้อมกัน
+    # ตัวที่มาทีหลังจะรอ แล้วเห็นตารางที่อัปเกรดเสร็จแล้ว (ไม่ ALTER ซ้ำ / ไม่ import CSV ซ้ำ)
+    store.conn.execute("PRAGMA busy_timeout=60000")
+    try:
+        with store.transaction() as conn:
+            store.ensure_schema(conn)
+            migrate_csv_orders(store)
+            migrate_order_status(store)
+            migrate_order_ids(store)
+            backfill_order_items(store)
+            migrate_menu_ids(store)
+            ensure_rollups(store)
+    finally:
+        store.conn.execute("PRAGMA busy_timeout=5000")
+    return store
+
+
+# ---------------- ORDER CACHE ----------------
+# Admin rerun บ่อยมาก (ทุกครั้งที่เปลี่ยน selectbox) → เก็บ DataFrame ไว้ในหน่วยความจำ
+# แล้วดึงเฉพาะแถวที่ id ใหม่กว่าที่เคยอ่าน แทนการอ่านทั้งตารางทุก rerun
+# พร้อม index: order_id (และ id แบบเก่า) → ตำแหน่งแถว และ index รองตามชื่อ / เบอร์ / วันที่ / เลขคิว
+class OrderCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ล้างทุกอย่าง (ยกเว้น lock) ให้โหลดใหม่ทั้งตาราง เช่น หลังย้ายออเดอร์เก่าออกจาก DB"""
+        self.chunks = []     # ก้อนละ ORDER_CACHE_CHUNK แถวพอดี ยกเว้นก้อนสุดท้าย
+        self.size = 0
+        self.frame = None    # ทั้งตารางที่รวมก้อนแล้ว (รวมเมื่อมีคนขอ ทิ้งเมื่อมีแถวใหม่)
+        self.last_id = 0
+        self.archive_run = 0   # archive_runs.id ล่าสุดที่เห็น: เปลี่ยน = มีออเดอร์ถูกย้ายออกจาก DB
+        self.signature = None
+        self.dirty = True
+        self.by_id = {}
+        self.by_legacy = {}
+        self.by_pickup = {}   # (วันที่, เลขคิว) → ตำแหน่งแถว
+        self.by_name = {}
+        self.by_phone = {}
+        self.by_day = {}
+
+    def index_rows(self, df_new, start: int):
+        """เพิ่มแถวใหม่ (ตำแหน่งเริ่มที่ start) เข้า index ทุกตัว"""
+        columns = zip(
+            df_new["order_id"], df_new["legacy_id"], df_new["pickup_no"],
+            df_new["name"], df_new["phone"], df_new["created_at"],
+        )
+        for pos, (order_id, legacy_id, pickup_no, name, phone, created_at) in enumerate(columns, start):
+            self.by_id[str(order_id)] = pos
+            if not pd.isna(legacy_id) and legacy_id:
+                self.by_legacy[str(legacy_id)] = pos
+            if not pd.isna(pickup_no):
+                self.by_pickup[(str(created_at)[:10], int(pickup_no))] = pos
+            name = "" if pd.isna(name) else str(name).strip().lower()
+            phone = "" if pd.isna(phone) else str(phone).strip()
+            self.by_name.setdefault(name, []).append(pos)
+            self.by_phone.setdefault(phone, []).append(pos)
+            self.by_day.setdefault(str(created_at)[:10], []).append(pos)
+
+    def append(self, df_new):
+        """ต่อแถวใหม่ท้าย cache (copy แค่ก้อนสุดท้าย ไม่ใช่ทั้งตาราง)"""
+        self.index_rows(df_new, self.size)
+        self.size += len(df_new)
+        self.frame = None
+        while not df_new.empty:
+            if self.chunks and len(self.chunks[-1]) < ORDER_CACHE_CHUNK:
+                room = ORDER_CACHE_CHUNK - len(self.chunks[-1])
+                self.chunks[-1] = pd.concat([self.chunks[-1], df_new.iloc[:room]], ignore_index=True)
+            else:
+                room = ORDER_CACHE_CHUNK
+                self.chunks.append(df_new.iloc[:room].reset_index(drop=True))
+            df_new = df_new.iloc[room:]
+
+    def df(self):
+        """ทั้งตารางเป็น DataFrame เดียว (ห้ามแก้ไขตรง ๆ เพราะแชร์กันทุก session)"""
+        if self.frame is None:
+            if len(self.chunks) > 1:
+                self.frame = pd.concat(self.chunks, ignore_index=True)
+            else:
+                self.frame = self.chunks[0] if self.chunks else pd.DataFrame(columns=ORDER_COLUMNS)
+        return self.frame
+
+    def row(self, pos: int):
+        return self.chunks[pos // ORDER_CACHE_CHUNK].iloc[pos % ORDER_CACHE_CHUNK]
+
+    def value(self, pos: int, column: str):
+        chunk = self.chunks[pos // ORDER_CACHE_CHUNK]
+        return chunk[column].iat[pos % ORDER_CACHE_CHUNK]
+
+    def tail(self, n: int):
+        """n แถวล่าสุด (ไม่ต้องรวมทั้งตาราง)"""
+        parts = []
+        for chunk in reversed(self.chunks):
+            parts.insert(0, chunk.iloc[-n:])
+            n -= len(parts[0])
+            if n <= 0:
+                break
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=ORDER_COLUMNS)
+
+    def set_value(self, pos: int, column: str, value):
+        chunk = self.chunks[pos // ORDER_CACHE_CHUNK]
+        chunk.iat[pos % ORDER_CACHE_CHUNK, chunk.columns.get_loc(column)] = value
+        if self.frame is not None and self.frame is not chunk:
+            self.frame.iat[pos, self.frame.columns.get_loc(column)] = value
+
+
+@st.cache_resource
+def get_order_cache() -> OrderCache:
+    cache = OrderCache()
+    register_gauge("order_cache_rows", lambda: cache.size)
+    return cache
+
+
+def orders_db_signature():
+    """(mtime, size) ของไฟล์ DB + WAL ใช้เช็คว่ามี process อื่นเขียนเพิ่มหรือไม่"""
+    signature = []
+    for path in (ORDERS_DB, ORDERS_DB + "-wal"):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def invalidate_orders_cache():
+    get_order_cache().dirty = True
+
+
+def sync_orders() -> OrderCache:
+    """ดึงเฉพาะออเดอร์ใหม่จาก DB เข้า cache (ไม่รวมทั้งตาราง) แล้วคืน cache"""
+    cache = get_order_cache()
+    with cache.lock:
+        signature = orders_db_signature()
+        if cache.dirty or signature != cache.signature:
+            cache.dirty = False
+            cache.signature = signature
+            store = get_order_store()
+            with store.lock:
+                archive_run = store.conn.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM archive_runs"
+                ).fetchone()[0]
+            if archive_run != cache.archive_run:
+                # มีการย้ายออเดอร์เก่าเข้าคลัง (ลบใน transaction เดียวกับที่เพิ่ม archive_runs)
+                # → ตำแหน่งใน index ใช้ไม่ได้แล้ว
+                cache.reset()
+                cache.dirty, cache.signature, cache.archive_run = False, signature, archive_run
+            df_new = store.read_df(
+                f"SELECT id, {', '.join(ORDER_COLUMNS)} FROM orders WHERE id > ? ORDER BY id",
+                (cache.last_id,),
+            )
+            if not df_new.empty:
+                cache.last_id = int(df_new["id"].iloc[-1])
+                cache.append(df_new[ORDER_COLUMNS])
+    return cache
+
+
+@timed("load_orders")
 def load_orders():
-    if os.path.exists(ORDERS_FILE):
-        return pd.read_csv(ORDERS_FILE)
-    return pd.DataFrame()
+    """คืน DataFrame ออเดอร์ทั้งหมด (ห้ามแก้ไขตรง ๆ เพราะแชร์กันทุก session)"""
+    cache = sync_orders()
+    with cache.lock:
+        return cache.df()
+
+
+def get_order_row(order_id: str):
+    """หาแถวออเดอร์จาก order_id หรือ id แบบเก่า แบบ O(1) ผ่าน index (ไม่เจอคืน None)"""
+    cache = sync_orders()
+    with cache.lock:
+        pos = cache.by_id.get(str(order_id))
+        if pos is None:
+            pos = cache.by_legacy.get(str(order_id))
+        if pos is None:
+            return None
+        return cache.row(pos)
+
+
+def order_option_label(order_id: str) -> str:
+    """ข้อความในช่องเลือกออเดอร์: เลขคิว · ชื่อ · เวลา (ยังเลือกด้วย order_id เหมือนเดิม)"""
+    cache = get_order_cache()   # search_orders โหลดล่าสุดไว้แล้ว ไม่ต้องเช็ค DB ซ้ำทุกตัวเลือก
+    with cache.lock:
+        pos = cache.by_id.get(str(order_id))
+        if pos is None:
+            return str(order_id)
+        row = cache.row(pos)
+    return f"{pickup_label(row['pickup_no'])} · {row['name']} · {row['created_at']}"
+
+
+def search_orders(query: str = "", date_from=None, date_to=None, limit: int = MAX_ORDER_OPTIONS):
+    """ค้นหาออเดอร์ตามชื่อ/เบอร์ (บางส่วนก็ได้), Order ID, เลขคิว (#12) + ช่วงวันที่ คืน order_id ล่าสุดก่อน"""
+    cache = sync_orders()
+    with cache.lock:
+        positions = None
+        days = []
+        if date_from is not None and date_to is not None:
+            positions = set()
+            day = date_from
+            while day <= date_to:
+                days.append(day.strftime("%Y-%m-%d"))
+                positions.update(cache.by_day.get(days[-1], []))
+                day += timedelta(days=1)
+
+        query = query.strip()
+        if query.startswith("#") and query[1:].isdigit():
+            # เลขคิวซ้ำกันได้คนละวัน → ไม่เลือกช่วงวันที่ก็ดูเฉพาะวันนี้
+            pickup_no = int(query[1:])
+            positions = {
+                cache.by_pickup[(day, pickup_no)]
+                for day in days or [datetime.now().strftime("%Y-%m-%d")]
+                if (day, pickup_no) in cache.by_pickup
+            }
+        elif query:
+            exact = cache.by_id.get(query.upper(), cache.by_legacy.get(query))
+            if exact is not None:
+                positions = {exact}
+            else:
+                # สแกนแค่ key ของ index (จำนวนลูกค้า) ไม่ใช่ทุกแถว
+                query = query.lower()
+                matched = set()
+                for index in (cache.by_name, cache.by_phone):
+                    for key, rows in index.items():
+                        if query in key:
+                            matched.update(rows)
+                positions = matched if positions is None else positions & matched
+
+        if positions is None:
+            positions = range(cache.size - 1, max(cache.size - 1 - limit, -1), -1)
+        else:
+            positions = sorted(positions, reverse=True)[:limit]
+        return [str(cache.value(pos, "order_id")) for pos in positions]
+
+
+def filter_orders(today_only=False, statuses=None, menus=None, pending_slip_only=False):
+    """กรองออเดอร์ฝั่ง server (ใหม่สุดก่อน) เพื่อส่งไปหน้าเว็บเฉพาะหน้าที่แสดง"""
+    cache = sync_orders()
+    with cache.lock:
+        df = cache.df()
+        if today_only:
+            df = df.iloc[cache.by_day.get(datetime.now().strftime("%Y-%m-%d"), [])]
+    if statuses:
+        df = df[df["status"].isin(statuses)]
+    if menus:
+        df = df[df["order_id"].isin(find_orders_with_menu(menus))]
+    if pending_slip_only:
+        df = df[df["slip_file"].fillna("").astype(str).str.strip() == ""]
+    return df.iloc[::-1]
+
+
+def find_orders_with_menu(item_ids) -> set:
+    """order_id ของออเดอร์ที่มีเมนูใดเมนูหนึ่งใน item_ids (ผ่าน index ของ order_items)"""
+    store = get_order_store()
+    placeholders = ", ".join("?" for _ in item_ids)
+    with store.lock:
+        rows = store.conn.execute(
+            "SELECT DISTINCT o.order_id FROM order_items i JOIN orders o ON o.id = i.order_pk "
+            f"WHERE i.item_id IN ({placeholders})",
+            list(item_ids),
+        ).fetchall()
+    return {row[0] for row in rows}
+
+
+def load_order_items(order_id: str):
+    """รายการเครื่องดื่มของออเดอร์ (list ของ dict ตามลำดับแก้ว)"""
+    store = get_order_store()
+    with store.lock:
+        rows = store.conn.execute(
+            f"SELECT {', '.join('i.' + c for c in ORDER_ITEM_COLUMNS)} "
+            "FROM order_items i JOIN orders o ON o.id = i.order_pk "
+            "WHERE o.order_id = ? ORDER BY i.order_pk, i.line_no",
+            (str(order_id),),
+        ).fetchall()
+    items = [dict(zip(ORDER_ITEM_COLUMNS, row)) for row in rows]
+    for item in items:
+        if item["item_id"]:
+            item["menu"] = menu_label(item["item_id"])
+    return items
+
+
+# ---------------- KITCHEN QUEUE ----------------
+# ออเดอร์ที่ยังไม่ปิด (received / making / ready) ถือไว้ในหน่วยความจำ
+# หน้าบาริสต้าอ่านจากตรงนี้ → ขนาดคงที่ตามคิวจริง ไม่โตตามประวัติออเดอร์
+class ActiveOrders:
+    def __init__(self, store: OrderStore):
+        self.lock = threading.Lock()
+        self.orders = {}
+        placeholders = ", ".join("?" for _ in OPEN_ORDER_STATUSES)
+        with store.lock:
+            rows = store.conn.execute(
+                "SELECT id, order_id, pickup_no, created_at, name, phone, status FROM orders "
+                f"WHERE status IN ({placeholders}) ORDER BY id",
+                OPEN_ORDER_STATUSES,
+            ).fetchall()
+        for order_pk, order_id, pickup_no, created_at, name, phone, status in rows:
+            self.orders[order_pk] = {
+                "order_pk": order_pk,
+                "order_id": order_id,
+                "pickup_no": pickup_no,
+                "created_at": created_at,
+                "name": name,
+                "phone": phone,
+                "status": status,
+                "items": load_order_items(order_id),
+            }
+
+    def add(self, order: dict):
+        with self.lock:
+            self.orders[order["order_pk"]] = order
+
+    def set_status(self, order_pk: int, status: str):
+        with self.lock:
+            order = self.orders.get(order_pk)
+            if order is None:
+                return
+            if status in ORDER_STATUS_NEXT:
+                order["status"] = status
+            else:
+                self.orders.pop(order_pk, None)
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(order) for order in self.orders.values()]
+
+
+@st.cache_resource
+def get_active_orders() -> ActiveOrders:
+    active = ActiveOrders(get_order_store())
+    register_gauge("active_orders", lambda: len(active.orders))
+    return active
+
+
+def set_order_status(order_pk: int, order_id: str, from_status: str, status: str) -> bool:
+    """เปลี่ยนสถานะออเดอร์เดียว เฉพาะเมื่อสถานะปัจจุบันยังเป็น from_status
+
+    ปุ่มที่ค้างบนจอ (อีกเครื่อง / ก่อน refresh) จะไม่ย้อนสถานะกลับ · คืน False ถ้าไม่ได้เปลี่ยน
+    """
+    with get_order_store().transaction() as conn:
+        changed = conn.execute(
+            "UPDATE orders SET status = ? WHERE id = ? AND status = ?",
+            (status, order_pk, from_status),
+        ).rowcount
+    if changed != 1:
+        return False
+    get_active_orders().set_status(order_pk, status)
+
+    # แก้ค่าใน DataFrame ที่ cache ไว้ด้วย จะได้ไม่ต้องโหลดใหม่ทั้งตาราง
+    cache = get_order_cache()
+    with cache.lock:
+        pos = cache.by_id.get(str(order_id))
+        if pos is not None:
+            cache.set_value(pos, "status", status)
+    return True
+
+
+@timed("save_order")
+def save_order(order_data: dict, items=None):
+    """บันทึกออเดอร์ + ทุกแก้วในตะกร้าใน transaction เดียว
+
+    คอลัมน์ menu / sweetness / note ของ orders เก็บสรุปรวมทุกแก้วไว้ดูเร็ว ๆ
+    ถ้าไม่ส่ง items มา จะถือว่าเป็นออเดอร์แก้วเดียวจากค่าใน order_data
+    ไม่ส่ง order_id มาจะออกให้ใหม่ · คืน order_data ที่บันทึกจริง (มี order_id และ pickup_no)
+    """
+    if items is None:
+        items = [{col: order_data.get(col, "") for col in ORDER_ITEM_COLUMNS}]
+    order_data = {
+        "menu": " + ".join(item.get("item_id") or item["menu"] for item in items),
+        "sweetness": " + ".join(item["sweetness"] for item in items),
+        "note": " | ".join(item["note"] for item in items if item["note"]),
+        **order_data,
+    }
+    if not order_data.get("order_id"):
+        order_data["order_id"] = new_order_id()
+    placeholders = ", ".join("?" for _ in ORDER_COLUMNS)
+    with get_order_store().transaction() as conn:
+        order_data["pickup_no"] = next_pickup_no(conn, str(order_data["created_at"])[:10])
+        cur = conn.execute(
+            f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) VALUES ({placeholders})",
+            [order_data.get(col, ORDER_DEFAULTS.get(col)) for col in ORDER_COLUMNS],
+        )
+        conn.executemany(
+            "INSERT INTO order_items (order_pk, line_no, item_id, menu, sweetness, note, price) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    cur.lastrowid, line_no, item.get("item_id") or None,
+                    # มี item_id แล้วไม่ต้องเก็บชื่อเต็มซ้ำ
+                    None if item.get("item_id") else item["menu"],
+                    item["sweetness"], item["note"], item["price"],
+                )
+                for line_no, item in enumerate(items, 1)
+            ],
+        )
+        update_rollups(conn, order_data, items)
+    invalidate_orders_cache()
+    get_active_orders().add({
+        "order_pk": cur.lastrowid,
+        "order_id": order_data["order_id"],
+        "pickup_no": order_data["pickup_no"],
+        "created_at": order_data["created_at"],
+        "name": order_data.get("name"),
+        "phone": order_data.get("phone"),
+        "status": order_data.get("status", ORDER_DEFAULTS["status"]),
+        "items": [
+            {**item, "menu": menu_label(item["item_id"]) if item.get("item_id") else item["menu"]}
+            for item in items
+        ],
+    })
+    return order_data
+
+
+def show_sales_dashboard():
+    """หน้า Admin: ยอดขายจากตารางสรุป (ไม่แตะตารางออเดอร์)"""
+    store = get_order_store()
+    today = datetime.now().date()
+    date_range = st.date_input("ช่วงวันที่", value=(today - timedelta(days=29), today), key="sales_range")
+    if not (isinstance(date_range, (list, tuple)) and len(date_range) == 2):
+        st.info("เลือกวันเริ่มต้นและวันสิ้นสุดก่อนนะคะ")
+        return
+    params = (date_range[0].strftime("%Y-%m-%d"), date_range[1].strftime("%Y-%m-%d"))
+
+    daily = store.read_df(
+        "SELECT day, orders, drinks, revenue, delivery_fee FROM sales_daily "
+        "WHERE day BETWEEN ? AND ? ORDER BY day",
+        params,
+    )
+    if daily.empty:
+        st.info("ยังไม่มียอดขายในช่วงนี้")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("ออเดอร์", f"{int(daily['orders'].sum()):,}")
+    col2.metric("แก้ว", f"{int(daily['drinks'].sum()):,}")
+    col3.metric("ยอดขาย", f"{int(daily['revenue'].sum()):,} บาท")
+    col4.metric("ค่าจัดส่ง", f"{int(daily['delivery_fee'].sum()):,} บาท")
 
+    st.markdown("#### 📅 ยอดขายรายวัน")
+    st.bar_chart(daily.set_index("day")["revenue"])
 
-def save_order(order_data: dict):
-    df_new = pd.DataFrame([order_data])
-    if os.path.exists(ORDERS_FILE):
-        df_old = pd.read_csv(ORDERS_FILE)
-        df_all = pd.concat([df_old, df_new], ignore_index=True)
+    hourly = store.read_df(
+        "SELECT hour, SUM(orders) AS orders, SUM(revenue) AS revenue FROM sales_hourly "
+        "WHERE day BETWEEN ? AND ? GROUP BY hour ORDER BY hour",
+        params,
+    )
+    st.markdown("#### ⏰ ยอดขายตามชั่วโมง")
+    st.bar_chart(hourly.set_index("hour")["revenue"])
+
+    menus = store.read_df(
+        "SELECT item_id, SUM(qty) AS qty, SUM(revenue) AS revenue FROM sales_daily_menu "
+        "WHERE day BETWEEN ? AND ? GROUP BY item_id ORDER BY qty DESC",
+        params,
+    )
+    menus.insert(0, "เมนู", menus["item_id"].map(menu_label))
+    st.markdown("#### 🏆 เมนูขายดี")
+    st.dataframe(menus.drop(columns="item_id").head(10), hide_index=True)
+
+    sweetness = store.read_df(
+        "SELECT sweetness, SUM(qty) AS qty FROM sales_daily_sweetness "
+        "WHERE day BETWEEN ? AND ? GROUP BY sweetness ORDER BY qty DESC",
+        params,
+    )
+    st.markdown("#### 🍬 สัดส่วนความหวาน")
+    st.bar_chart(sweetness.set_index("sweetness")["qty"])
+
+    if st.button("🔄 คำนวณตารางสรุปใหม่ทั้งหมด"):
+        rebuild_rollups(store)
+        st.rerun()
+
+
+def bucket_quantile(buckets, count: int, q: float):
+    """ค่าประมาณ percentile จาก histogram (ขอบบนของ bucket ที่ถึงสัดส่วน q)"""
+    cumulative = 0
+    for bound, n in zip(METRICS_BUCKETS, buckets):
+        cumulative += n
+        if cumulative >= q * count:
+            return bound
+    return None
+
+
+def show_system_health():
+    """หน้า Admin: เวลาแต่ละขั้น, ความยาวคิว และจำนวน error จาก metrics ในหน่วยความจำ"""
+    if not METRICS_ENABLED:
+        st.info("ปิดการวัดเวลาอยู่ (METRICS_ENABLED = false)")
+        return
+    # สร้าง resource ที่มี gauge ไว้ก่อน จะได้เห็นครบตั้งแต่เปิดหน้าแรก
+    get_order_cache()
+    get_active_orders()
+    get_notification_dispatcher()
+    timings, counters, gauges = get_metrics().snapshot()
+
+    gauge_labels = {
+        "notify_queue_depth": "คิวแจ้งเตือน (ในหน่วยความจำ)",
+        "notify_outbox_pending": "แจ้งเตือนค้างส่ง (outbox)",
+        "active_orders": "ออเดอร์ที่ยังไม่ปิด",
+        "order_cache_rows": "แถวออเดอร์ใน cache",
+    }
+    cols = st.columns(len(gauge_labels))
+    for col, (name, label) in zip(cols, gauge_labels.items()):
+        value = gauges.get(name)
+        col.metric(label, "-" if value is None else f"{value:,}")
+
+    st.markdown("#### ⏱️ เวลาแต่ละขั้น")
+    rows = []
+    for (name, labels), timing in sorted(timings.items()):
+        p95 = bucket_quantile(timing["buckets"], timing["count"], 0.95)
+        rows.append({
+            "ขั้นตอน": name + "".join(f" [{v}]" for _, v in labels),
+            "ครั้ง": timing["count"],
+            "เฉลี่ย (ms)": round(timing["sum"] / timing["count"] * 1000, 1),
+            "p95 ≤ (ms)": "> 10000" if p95 is None else int(p95 * 1000),
+            "สูงสุด (ms)": round(timing["max"] * 1000, 1),
+            "error": counters.get(("errors", (("op", name),)), 0),
+        })
+    if rows:
+        st.dataframe(pd.DataFrame(rows), hide_index=True)
     else:
-        df_all = df_new
-    df_all.to_csv(ORDERS_FILE, index=False)
+        st.info("ยังไม่มีข้อมูลเวลา")
 
+    st.download_button(
+        "⬇️ Metrics (Prometheus text)",
+        data=get_metrics().prometheus_text,
+        file_name="metrics.txt",
+        mime="text/plain",
+    )
+    if METRICS_PORT:
+        st.caption(f"Prometheus ดึงได้ที่ http://<host>:{METRICS_PORT}/metrics")
 
-def show_qr_image():
-    qr_files = ["qr_matcha.jpeg", "qr_matcha.jpg", "qr_matcha.png"]
-    found = False
-    for f in qr_files:
+
+# ---------------- RECEIPTS ----------------
+# ใบรับออเดอร์ใช้ template เดียว (compile ครั้งเดียว) ทั้งแบบใบเดียวและแบบพิมพ์ทั้งช่วงวันที่
+RECEIPT_PAGE_HEAD = Template("""<html>
+  <head>
+    <meta charset="utf-8" />
+    <title>$title</title>
+    <style>
+      body { font-family: sans-serif; }
+      .receipt { max-width: 400px; margin: 0 auto; page-break-after: always; }
+    </style>
+  </head>
+  <body>
+""")
+RECEIPT_PAGE_TAIL = """  </body>
+</html>
+"""
+RECEIPT_BODY = Template("""    <section class="receipt">
+    <h2>ใบรับออเดอร์ · คิว $pickup</h2>
+    <p><strong>Order ID:</strong> $order_id<br/>
+       <strong>วันที่:</strong> $created_at<br/>
+       <strong>ชื่อลูกค้า:</strong> $name<br/>
+       <strong>เบอร์โทร:</strong> $phone</p>
+    <hr/>
+    <h3>รายการเครื่องดื่ม ($item_count แก้ว)</h3>
+    <p>
+       $items
+    </p>
+    <p>ยอดรวมทั้งหมด: $total_price บาท</p>
+    <hr/>
+    <p style="text-align:center;">ขี้เกียจมาก แต่ลูกค้าอยากกิงอีก จัดไปฮะๆ อิอิ🩷❤️🩵💙💜💖</p>
+    </section>
+""")
+EXPORT_CHUNK_ROWS = 500
+
+
+def render_receipt(order, items) -> str:
+    item_lines = "<br/>\n       ".join(
+        html.escape(
+            f"{i}. {item['menu']} – {item['sweetness']}"
+            + (f" (โน้ต: {item['note']})" if item["note"] else "")
+        )
+        for i, item in enumerate(items, 1)
+    )
+    return RECEIPT_BODY.substitute(
+        order_id=html.escape(str(order["order_id"])),
+        pickup=pickup_label(order.get("pickup_no")),
+        created_at=html.escape(str(order["created_at"])),
+        name=html.escape(str(order["name"])),
+        phone=html.escape(str(order["phone"])),
+        item_count=len(items),
+        items=item_lines,
+        total_price=order.get("total_price", 0),
+    )
+
+
+def iter_orders_with_items(date_from, date_to):
+    """ไล่ออเดอร์ในช่วงวันที่ทีละชุด พร้อมรายการเครื่องดื่ม (ไม่โหลดทั้งหมดเข้าหน่วยความจำ)
+
+    ใช้ connection อ่านอย่างเดียวแยกต่างหาก จะได้ไม่ขวางการรับออเดอร์ระหว่าง export
+    ออเดอร์ที่ย้ายเข้าคลังแล้วอ่านจาก Parquet ทีละเดือนก่อน
+    """
+    yield from iter_archived_orders(date_from, date_to)
+    conn = sqlite3.connect(f"file:{ORDERS_DB}?mode=ro", uri=True)
+    try:
+        cur = conn.execute(
+            "SELECT o.id, o.order_id, o.created_at, o.name, o.phone, o.total_price, o.slip_file, "
+            "       i.item_id, i.menu, i.sweetness, i.note, i.price, o.pickup_no "
+            "FROM orders o LEFT JOIN order_items i ON i.order_pk = o.id "
+            "WHERE o.created_at BETWEEN ? AND ? ORDER BY o.created_at, o.id, i.line_no",
+            (f"{date_from:%Y-%m-%d} 00:00:00", f"{date_to:%Y-%m-%d} 23:59:59"),
+        )
+        rows = iter(functools.partial(cur.fetchmany, EXPORT_CHUNK_ROWS), [])
+        flat_rows = (row for chunk in rows for row in chunk)
+        for _, group in groupby(flat_rows, key=lambda row: row[0]):
+            group = list(group)
+            first = group[0]
+            order = {
+                "order_id": first[1], "created_at": first[2], "name": first[3],
+                "phone": first[4], "total_price": first[5], "slip_file": first[6],
+                "pickup_no": first[12],
+            }
+            items = [
+                {
+                    "menu": menu_label(row[7]) if row[7] else row[8],
+                    "sweetness": row[9], "note": row[10], "price": row[11],
+                }
+                for row in group if row[7] or row[8]
+            ]
+            yield order, items
+    finally:
+        conn.close()
+
+
+def iter_receipts_html(date_from, date_to):
+    yield RECEIPT_PAGE_HEAD.substitute(title=f"Orders {date_from} – {date_to}")
+    for order, items in iter_orders_with_items(date_from, date_to):
+        yield render_receipt(order, items)
+    yield RECEIPT_PAGE_TAIL
+
+
+def export_receipts_html(date_from, date_to):
+    """ใบรับออเดอร์ทุกใบในช่วงวันที่ เป็น HTML ไฟล์เดียว (1 ใบต่อหน้า สั่ง Print / Save as PDF ได้)
+
+    คืน bytes ทั้งไฟล์ (st.download_button ต้องถือข้อมูลทั้งก้อนตอนส่งอยู่แล้ว)
+    """
+    buf = io.BytesIO()
+    for chunk in iter_receipts_html(date_from, date_to):
+        buf.write(chunk.encode("utf-8"))
+    return buf.getvalue()
+
+
+def export_slips_zip(date_from, date_to):
+    """ZIP รวมรูปสลิปของออเดอร์ในช่วงวันที่ (อ่านทีละไฟล์จากดิสก์) คืนเป็น bytes"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        seen = set()
+        for order, _ in iter_orders_with_items(date_from, date_to):
+            slip_name = order["slip_file"]
+            if not slip_name or slip_name in seen:
+                continue
+            seen.add(slip_name)
+            slip_path = find_slip_path(slip_name)
+            if slip_path:
+                zf.write(slip_path, arcname=f"{order['order_id']}_{slip_name}")
+    return buf.getvalue()
+
+
+# ---------------- SLIPS ----------------
+def slip_thumb_path(slip_name: str) -> str:
+    return os.path.join(SLIP_THUMBS_DIR, slip_name)
+
+
+def find_archived_slip(slip_name: str):
+    """path ของสลิปที่ย้ายไป slips/archive/YYYY/MM แล้ว (ไม่เจอคืน None)"""
+    if not slip_name:
+        return None
+    matches = glob.glob(os.path.join(glob.escape(SLIPS_ARCHIVE_DIR), "*", "*", glob.escape(slip_name)))
+    return matches[0] if matches else None
+
+
+def find_slip_path(slip_name: str):
+    """path ของไฟล์สลิป: ดูโฟลเดอร์หลักก่อน แล้วค่อยดูในคลัง (ไม่เจอคืน None)"""
+    if not slip_name:
+        return None
+    slip_path = os.path.join(SLIPS_DIR, slip_name)
+    if os.path.isfile(slip_path):
+        return slip_path
+    return find_archived_slip(slip_name)
+
+
+@timed("ingest_slip")
+def ingest_slip(upload) -> str:
+    """รับไฟล์สลิปแบบทีละ chunk → ตรวจว่าเป็นรูปจริง → ย่อ/บีบอัด → เก็บชื่อตาม hash
+
+    คืนชื่อไฟล์สลิป (สลิปเดิมอัปโหลดซ้ำจะได้ชื่อเดิม ไม่เก็บซ้ำ)
+    ไฟล์ไม่ใช่รูปหรือใหญ่เกินจะ raise ValueError
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, upload_path = tempfile.mkstemp(dir=SLIPS_DIR, suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            upload.seek(0)
+            while True:
+                chunk = upload.read(SLIP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > SLIP_UPLOAD_LIMIT:
+                    raise ValueError("ไฟล์สลิปใหญ่เกินไป (ไม่เกิน 15MB นะคะ)")
+                digest.update(chunk)
+                f.write(chunk)
+
+        slip_name = f"slip_{digest.hexdigest()[:32]}.jpg"
+        slip_path = os.path.join(SLIPS_DIR, slip_name)
+        if os.path.exists(slip_path):
+            return slip_name
+
+        try:
+            with Image.open(upload_path) as img:
+                img.verify()
+            with Image.open(upload_path) as img:
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                img.thumbnail((SLIP_MAX_SIDE, SLIP_MAX_SIDE))
+                img.save(upload_path + ".jpg", "JPEG", quality=SLIP_JPEG_QUALITY, optimize=True)
+                img.thumbnail((SLIP_THUMB_SIDE, SLIP_THUMB_SIDE))
+                img.save(slip_thumb_path(slip_name), "JPEG", quality=SLIP_JPEG_QUALITY)
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            raise ValueError("ไฟล์ที่อัปโหลดไม่ใช่รูปภาพ กรุณาแนบรูปสลิปค่ะ")
+        os.replace(upload_path + ".jpg", slip_path)
+        return slip_name
+    finally:
+        for path in (upload_path, upload_path + ".jpg"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def find_order_by_slip_in_db(slip_name: str):
+    store = get_order_store()
+    with store.lock:
+        row = store.conn.execute(
+            "SELECT order_id FROM orders WHERE slip_file = ? LIMIT 1", (slip_name,)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def find_order_by_slip(slip_name: str):
+    """คืน order_id ที่เคยใช้สลิปนี้แล้ว (ไม่มีคืน None) – ใช้จับสลิปซ้ำ"""
+    order_id = find_order_by_slip_in_db(slip_name)
+    if order_id:
+        return order_id
+    # สลิปของออเดอร์ที่ย้ายเข้าคลังแล้ว: โฟลเดอร์ปี/เดือนบอกว่าต้องเปิด Parquet เดือนไหน
+    archived = find_archived_slip(slip_name)
+    if archived is None:
+        return None
+    year, month = os.path.normpath(archived).split(os.sep)[-3:-1]
+    orders, _ = load_archive_month(f"{year}-{month}")
+    matched = orders.loc[orders["slip_file"] == slip_name, "order_id"]
+    return str(matched.iloc[0]) if not matched.empty else None
+
+
+def render_jpeg(path: str, max_side: int, quality: int = SLIP_JPEG_QUALITY) -> bytes:
+    """ย่อรูปให้ด้านยาวไม่เกิน max_side แล้วคืนเป็น JPEG bytes"""
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((max_side, max_side))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def load_slip_image(slip_name: str, full_size: bool = False):
+    """รูปสลิปสำหรับหน้า Admin: thumbnail (ค่าเริ่มต้น) หรือรูปเต็มเมื่อกดดู
+
+    สลิปเก่าที่ยังไม่มี thumbnail จะถูกสร้างเก็บไว้ให้ครั้งแรกที่เปิดดู
+    ไม่พบไฟล์คืน None
+    """
+    slip_path = find_slip_path(slip_name)
+    if slip_path is None:
+        return None
+    if full_size:
+        # สลิปใหม่ถูกย่อไว้แล้วตอนรับไฟล์ ส่งไฟล์ตรง ๆ ได้เลย
+        if os.path.getsize(slip_path) <= SLIP_UPLOAD_LIMIT // 10:
+            with open(slip_path, "rb") as f:
+                return f.read()
+        return render_jpeg(slip_path, SLIP_MAX_SIDE)
+    thumb_path = slip_thumb_path(slip_name)
+    if not os.path.exists(thumb_path):
+        with open(thumb_path, "wb") as f:
+            f.write(render_jpeg(slip_path, SLIP_THUMB_SIDE))
+    with open(thumb_path, "rb") as f:
+        return f.read()
+
+
+@st.cache_resource
+def load_qr_image():
+    """หาไฟล์ QR ครั้งเดียวต่อ process แล้วเก็บ JPEG ที่ย่อแล้วไว้ใช้ทุก session"""
+    for f in QR_FILES:
         if os.path.exists(f):
-            st.image(f, caption="สแกนเพื่อชำระเงิน", use_column_width=True)
-            found = True
-            break
-    if not found:
+            with open(f, "rb") as fp:
+                original = fp.read()
+            rendition = render_jpeg(f, QR_MAX_SIDE, quality=85)
+            # ถ้าไฟล์เดิมเล็กกว่าอยู่แล้วก็ใช้ไฟล์เดิม
+            return rendition if len(rendition) < len(original) else original
+    return None
+
+
+def show_qr_image():
+    qr_image = load_qr_image()
+    if qr_image is not None:
+        st.image(qr_image, caption="สแกนเพื่อชำระเงิน", width="stretch")
+    else:
         st.warning("⚠️ ไม่พบไฟล์ QR Code (ต้องมี qr_matcha.jpeg/.jpg/.png อยู่โฟลเดอร์เดียวกับ app.py)")
 
 
-def send_line_notify(message: str):
-    """ส่งข้อความแจ้งเตือนไป LINE Notify (ถ้าเซ็ต token ไว้)"""
-    if not LINE_NOTIFY_TOKEN:
-        return
-    url = "https://notify-api.line.me/api/notify"
-    headers = {"Authorization": f"Bearer {LINE_NOTIFY_TOKEN}"}
-    payload = {"message": message}
+# ---------------- ARCHIVE ----------------
+# ออเดอร์ที่ปิดแล้วและเก่ากว่า RETENTION_DAYS ย้ายไปเก็บเป็น Parquet รายเดือน
+# (archive/orders/YYYY-MM.parquet + YYYY-MM.items.parquet) แล้วลบออกจาก DB
+# → DB / cache / หน้า Admin เหลือแค่ออเดอร์ช่วงหลัง ยอดขายใน sales_* ยังอยู่ครบ
+ARCHIVE_ITEM_COLUMNS = ["order_id", "line_no", "item_id", "menu", "sweetness", "note", "price"]
+
+
+def archive_paths(month: str):
+    return (
+        os.path.join(ORDERS_ARCHIVE_DIR, f"{month}.parquet"),
+        os.path.join(ORDERS_ARCHIVE_DIR, f"{month}.items.parquet"),
+    )
+
+
+def list_archive_months() -> list:
+    """เดือนที่มีในคลัง (YYYY-MM) เรียงจากเก่าไปใหม่"""
+    if not os.path.isdir(ORDERS_ARCHIVE_DIR):
+        return []
+    return sorted(
+        name[:7] for name in os.listdir(ORDERS_ARCHIVE_DIR)
+        if len(name) == len("YYYY-MM.parquet") and name.endswith(".parquet")
+    )
+
+
+def read_archive_month(month: str):
+    """(orders, items) ของเดือนนั้นจาก Parquet (ไม่มีไฟล์คืน DataFrame ว่าง)"""
+    orders_path, items_path = archive_paths(month)
+    if not os.path.exists(orders_path):
+        return pd.DataFrame(columns=ORDER_COLUMNS), pd.DataFrame(columns=ARCHIVE_ITEM_COLUMNS)
+    items = pd.read_parquet(items_path) if os.path.exists(items_path) \
+        else pd.DataFrame(columns=ARCHIVE_ITEM_COLUMNS)
+    return pd.read_parquet(orders_path), items
+
+
+@st.cache_data(max_entries=24, show_spinner=False)
+def load_archive_month_cached(month: str, mtime_ns: int):
+    return read_archive_month(month)
+
+
+def load_archive_month(month: str):
+    """อ่านเดือนในคลังเมื่อเปิดดูเท่านั้น แล้ว cache ไว้จนกว่าไฟล์จะถูกเขียนใหม่"""
+    orders_path, _ = archive_paths(month)
+    try:
+        mtime_ns = os.stat(orders_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = 0
+    return load_archive_month_cached(month, mtime_ns)
+
+
+def archived_items(items) -> list:
+    items = items.astype(object).where(items.notna(), None)   # item_id ว่างจาก Parquet เป็น NaN (ซึ่งเป็น truthy)
+    return [
+        {
+            "menu": menu_label(item_id) if item_id else menu,
+            "sweetness": sweetness, "note": note, "price": price,
+        }
+        for item_id, menu, sweetness, note, price in zip(
+            items["item_id"], items["menu"], items["sweetness"], items["note"], items["price"]
+        )
+    ]
+
+
+def iter_archived_orders(date_from, date_to):
+    """ออเดอร์ในคลังช่วงวันที่ (รูปแบบเดียวกับ iter_orders_with_items) อ่านทีละเดือน"""
+    start, end = f"{date_from:%Y-%m-%d} 00:00:00", f"{date_to:%Y-%m-%d} 23:59:59"
+    for month in list_archive_months():
+        if not f"{date_from:%Y-%m}" <= month <= f"{date_to:%Y-%m}":
+            continue
+        orders, items = read_archive_month(month)
+        orders = orders[(orders["created_at"] >= start) & (orders["created_at"] <= end)]
+        orders = orders.astype(object).where(orders.notna(), None)   # NaN → None แบบเดียวกับจาก DB
+        items_by_order = dict(tuple(items.sort_values("line_no").groupby("order_id", sort=False)))
+        for order in orders.sort_values("created_at").to_dict("records"):
+            order_items = items_by_order.get(order["order_id"])
+            yield order, [] if order_items is None else archived_items(order_items)
+
+
+def write_archive_month(month: str, orders, items):
+    """รวมออเดอร์เข้า Parquet ของเดือนนั้น (มีไฟล์อยู่แล้วจะรวมกัน ไม่เก็บซ้ำ)"""
+    os.makedirs(ORDERS_ARCHIVE_DIR, exist_ok=True)
+    old_orders, old_items = read_archive_month(month)
+    if not old_orders.empty:
+        orders = pd.concat([old_orders, orders], ignore_index=True).drop_duplicates("order_id", keep="last")
+        items = pd.concat([old_items, items], ignore_index=True).drop_duplicates(
+            ["order_id", "line_no"], keep="last"
+        )
+    # เขียนไฟล์ items ก่อน แล้วค่อยแทนที่ไฟล์ orders (ไฟล์ orders คือตัวบอกว่ามีเดือนนี้)
+    orders_path, items_path = archive_paths(month)
+    for df, path in ((items, items_path), (orders, orders_path)):
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+
+def path_size(path: str) -> int:
+    """ขนาดไฟล์ หรือผลรวมขนาดทุกไฟล์ในโฟลเดอร์ (ไม่มีคืน 0)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def orders_db_size() -> int:
+    return sum(path_size(ORDERS_DB + suffix) for suffix in ("", "-wal"))
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:,.0f} {unit}" if unit == "B" else f"{size:,.1f} {unit}"
+        size /= 1024
+    return f"{size:,.1f} GB"
+
+
+@timed("retention")
+def run_retention(cutoff: str) -> dict:
+    """ย้ายออเดอร์ที่ปิดแล้วก่อนวัน cutoff (YYYY-MM-DD) เข้าคลัง + ย้ายสลิป + VACUUM DB
+
+    ออเดอร์ที่ยังไม่ปิด (รับแล้ว / กำลังทำ / พร้อมรับ) ไม่ถูกแตะ
+    คืนสรุปผล: จำนวนออเดอร์/เดือน/สลิปที่ย้าย และพื้นที่ที่ได้คืน (ไบต์)
+    """
+    store = get_order_store()
+    placeholders = ", ".join("?" for _ in OPEN_ORDER_STATUSES)
+    where = f"o.created_at < ? AND o.status NOT IN ({placeholders})"
+    params = (cutoff, *OPEN_ORDER_STATUSES)
+    result = {"orders": 0, "months": 0, "slips": 0, "reclaimed_bytes": 0, "archive_bytes": 0}
+
+    orders = store.read_df(
+        f"SELECT o.id, {', '.join('o.' + c for c in ORDER_COLUMNS)} FROM orders o WHERE {where} ORDER BY o.id",
+        params,
+    )
+    if orders.empty:
+        return result
+    items = store.read_df(
+        f"SELECT {', '.join(('o.order_id',) + tuple('i.' + c for c in ARCHIVE_ITEM_COLUMNS[1:]))} "
+        f"FROM order_items i JOIN orders o ON o.id = i.order_pk WHERE {where} ORDER BY i.order_pk, i.line_no",
+        params,
+    )
+    with store.lock:
+        store.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_before = orders_db_size()
+    archive_before = path_size(ORDERS_ARCHIVE_DIR)
+
+    # 1) เขียน Parquet ให้เสร็จก่อนลบจาก DB (ดับกลางทาง → รอบหน้ารวมซ้ำได้ ไม่หาย)
+    months = orders["created_at"].str[:7]
+    for month, month_orders in orders.groupby(months):
+        write_archive_month(
+            month,
+            month_orders[ORDER_COLUMNS],
+            items[items["order_id"].isin(month_orders["order_id"])],
+        )
+
+    # 2) ลบจาก DB (ออเดอร์ที่ปิดแล้วไม่ถูกแก้อีก จึงลบตาม id ที่อ่านไว้ได้)
+    #    บันทึก cutoff ใน transaction เดียวกับการลบ → ถ้าขั้นต่อไปพัง rebuild_rollups ก็ยังรู้ว่า
+    #    วันก่อน cutoff ไม่อยู่ใน DB แล้ว จะไม่ลบยอดสรุปของวันเหล่านั้นทิ้ง
+    ids = orders["id"].tolist()
+    with store.transaction() as conn:
+        run_id = conn.execute(
+            "INSERT INTO archive_runs (ran_at, cutoff, orders, slips, reclaimed_bytes) VALUES (?, ?, ?, 0, 0)",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), cutoff, len(ids)),
+        ).lastrowid
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ", ".join("?" for _ in chunk)
+            conn.execute(f"DELETE FROM order_items WHERE order_pk IN ({marks})", chunk)
+            conn.execute(f"DELETE FROM orders WHERE id IN ({marks})", chunk)
+    invalidate_orders_cache()
+
+    # 3) ย้ายสลิปไป slips/archive/YYYY/MM (thumbnail ลบทิ้ง เปิดดูเมื่อไหร่ค่อยสร้างใหม่)
+    reclaimed_thumbs = 0
+    for slip_name, created_at in zip(orders["slip_file"], orders["created_at"]):
+        if not isinstance(slip_name, str) or not slip_name or find_order_by_slip_in_db(slip_name):
+            continue
+        slip_path = os.path.join(SLIPS_DIR, slip_name)
+        if not os.path.isfile(slip_path):
+            continue
+        shard_dir = os.path.join(SLIPS_ARCHIVE_DIR, created_at[:4], created_at[5:7])
+        os.makedirs(shard_dir, exist_ok=True)
+        os.replace(slip_path, os.path.join(shard_dir, slip_name))
+        thumb_path = slip_thumb_path(slip_name)
+        if os.path.exists(thumb_path):
+            reclaimed_thumbs += os.path.getsize(thumb_path)
+            os.remove(thumb_path)
+        result["slips"] += 1
+
+    # 4) คืนพื้นที่ไฟล์ DB: ใช้ connection แยก ไม่ถือ store.lock (หน้าอื่นยังอ่านได้)
+    #    ระหว่าง VACUUM การบันทึกออเดอร์จะรอ (ไม่เกิน busy_timeout) → ควรสั่งตอนร้านปิด
+    vacuum_conn = sqlite3.connect(ORDERS_DB, isolation_level=None)
     try:
-        requests.post(url, headers=headers, data=payload, timeout=5)
-    except Exception as e:
-        print("LINE notify error:", e)
+        vacuum_conn.execute("PRAGMA busy_timeout=5000")
+        vacuum_conn.execute("VACUUM")
+        vacuum_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.OperationalError as e:
+        # ข้อมูลย้ายเข้าคลังครบแล้ว แค่ยังไม่คืนพื้นที่ไฟล์ → สั่งใหม่ทีหลังได้
+        result["vacuum_error"] = str(e)
+    finally:
+        vacuum_conn.close()
+
+    result.update(
+        orders=len(orders),
+        months=months.nunique(),
+        reclaimed_bytes=db_before - orders_db_size() + reclaimed_thumbs,
+        archive_bytes=path_size(ORDERS_ARCHIVE_DIR) - archive_before,
+    )
+    with store.transaction() as conn:
+        conn.execute(
+            "UPDATE archive_runs SET slips = ?, reclaimed_bytes = ? WHERE id = ?",
+            (result["slips"], result["reclaimed_bytes"], run_id),
+        )
+    return result
+
+
+def show_archive_page():
+    """หน้า Admin: สั่งย้ายออเดอร์เก่าเข้าคลัง + เปิดดูออเดอร์ในคลังทีละเดือน"""
+    store = get_order_store()
+    stats = st.container()   # เติมทีหลัง จะได้เห็นตัวเลขหลังกดย้ายในรอบเดียวกัน
+
+    st.markdown("#### 🧹 ย้ายออเดอร์เก่าเข้าคลัง")
+    keep_days = st.number_input("เก็บออเดอร์ไว้ใน DB ย้อนหลัง (วัน)", min_value=7, value=RETENTION_DAYS, step=1)
+    cutoff = (datetime.now().date() - timedelta(days=int(keep_days))).strftime("%Y-%m-%d")
+    st.caption(
+        f"ออเดอร์ที่ปิดแล้วก่อนวันที่ {cutoff} จะย้ายไป {ORDERS_ARCHIVE_DIR}/YYYY-MM.parquet "
+        f"และสลิปย้ายไป {SLIPS_ARCHIVE_DIR}/YYYY/MM (ยอดขายในหน้า 📊 ยังอยู่ครบ)"
+    )
+    st.warning("ขั้นสุดท้าย (VACUUM) จะพักการบันทึกออเดอร์ใหม่ชั่วคราวจนกว่าจะเสร็จ แนะนำให้กดตอนร้านปิดค่ะ")
+    if st.button("🧹 ย้ายเข้าคลังตอนนี้"):
+        with st.spinner("กำลังย้ายออเดอร์เก่าเข้าคลัง..."):
+            result = run_retention(cutoff)
+        if result["orders"]:
+            st.success(
+                f"ย้าย {result['orders']:,} ออเดอร์ ({result['months']} เดือน) และสลิป {result['slips']:,} ไฟล์ · "
+                f"คืนพื้นที่ {format_bytes(result['reclaimed_bytes'])} "
+                f"(คลังเพิ่มขึ้น {format_bytes(result['archive_bytes'])})"
+            )
+            if result.get("vacuum_error"):
+                st.warning(f"ยังคืนพื้นที่ไฟล์ DB ไม่ได้ ({result['vacuum_error']}) ลองกดใหม่ตอนร้านปิดนะคะ")
+        else:
+            st.info("ไม่มีออเดอร์เก่าที่ต้องย้ายค่ะ")
+
+    with store.lock:
+        hot_orders = store.conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    hot_slips = sum(1 for entry in os.scandir(SLIPS_DIR) if entry.is_file())
+    col1, col2, col3, col4 = stats.columns(4)
+    col1.metric("ออเดอร์ใน DB", f"{hot_orders:,}")
+    col2.metric("ขนาด DB", format_bytes(orders_db_size()))
+    col3.metric("สลิปในโฟลเดอร์หลัก", f"{hot_slips:,}")
+    col4.metric("ขนาดคลัง", format_bytes(path_size(ORDERS_ARCHIVE_DIR) + path_size(SLIPS_ARCHIVE_DIR)))
+
+    runs = store.read_df(
+        "SELECT ran_at, cutoff, orders, slips, reclaimed_bytes FROM archive_runs ORDER BY id DESC LIMIT 20"
+    )
+    if not runs.empty:
+        runs["reclaimed_bytes"] = runs["reclaimed_bytes"].map(format_bytes)
+        st.dataframe(runs, hide_index=True)
+
+    st.markdown("#### 🗄️ ออเดอร์ในคลัง")
+    months = list_archive_months()
+    if not months:
+        st.caption("ยังไม่มีออเดอร์ในคลัง")
+        return
+    month = st.selectbox("เดือน", months[::-1])
+    orders, items = load_archive_month(month)
+    query = st.text_input("ค้นหาชื่อ / เบอร์โทร / Order ID", key="archive_query").strip()
+    if query:
+        orders = orders[
+            orders["name"].fillna("").str.lower().str.contains(query.lower(), regex=False)
+            | orders["phone"].fillna("").str.contains(query, regex=False)
+            | (orders["order_id"] == query.upper())
+            | (orders["legacy_id"] == query)
+        ]
+    orders = orders.sort_values("created_at", ascending=False)
+    st.caption(f"{len(orders):,} ออเดอร์")
+    st.dataframe(orders.head(MAX_ORDER_OPTIONS), hide_index=True)
+    if orders.empty:
+        return
+
+    rows = orders.head(MAX_ORDER_OPTIONS).set_index("order_id", drop=False)
+    selected_id = st.selectbox(
+        "เลือกออเดอร์",
+        rows.index.tolist(),
+        format_func=lambda oid: f"{pickup_label(rows.at[oid, 'pickup_no'])} · {rows.at[oid, 'name']} · "
+                                f"{rows.at[oid, 'created_at']}",
+        key="archive_order",
+    )
+    row = rows.loc[selected_id]
+    order_items = archived_items(items[items["order_id"] == selected_id].sort_values("line_no"))
+    slip_image = load_slip_image(row["slip_file"]) if isinstance(row["slip_file"], str) else None
+    if slip_image is not None:
+        st.image(slip_image, caption="สลิป (ในคลัง)", width=SLIP_THUMB_SIDE)
+    st.download_button(
+        "⬇️ ดาวน์โหลด Slip (HTML สำหรับ Print)",
+        data=(
+            RECEIPT_PAGE_HEAD.substitute(title=html.escape(f"Order {selected_id}"))
+            + render_receipt(row, order_items)
+            + RECEIPT_PAGE_TAIL
+        ).encode("utf-8"),
+        file_name=f"order_{selected_id}.html",
+        mime="text/html",
+        key="archive_receipt",
+    )
+
+
+# ---------------- NOTIFICATIONS ----------------
+# ปุ่มยืนยันออเดอร์แค่บันทึกข้อความลง outbox (ตารางใน DB) แล้วคืนทันที
+# worker thread เบื้องหลังเป็นคนส่งจริง + retry แบบ exponential backoff
+# ข้อความที่ยังส่งไม่สำเร็จอยู่ใน outbox → รีสตาร์ทแอปแล้วก็ส่งต่อได้
+NOTIFY_OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notify_outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    message         TEXT NOT NULL,
+    created_at      TEXT NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_notify_outbox_due ON notify_outbox(status, next_attempt_at);
+"""
+
+
+class LineMessagingBackend:
+    """ส่ง push message ผ่าน LINE Messaging API"""
+
+    url = "https://api.line.me/v2/bot/message/push"
+
+    def send(self, session, message: str):
+        response = session.post(
+            self.url,
+            headers={"Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"},
+            json={"to": LINE_TO, "messages": [{"type": "text", "text": message[:5000]}]},
+            timeout=5,
+        )
+        response.raise_for_status()
+
+
+class WebhookBackend:
+    """POST JSON {"text": ...} ไปยัง webhook (เช่น Discord/Slack/Google Chat/บอทของเราเอง)"""
+
+    def send(self, session, message: str):
+        response = session.post(NOTIFY_WEBHOOK_URL, json={"text": message}, timeout=5)
+        response.raise_for_status()
+
+
+class StubBackend:
+    """ไม่ส่งออกเน็ต แค่เขียนลงไฟล์ log ไว้ทดสอบ"""
+
+    def send(self, session, message: str):
+        with open(NOTIFY_STUB_FILE, "a", encoding="utf-8") as f:
+            f.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {message}\n")
+
+
+NOTIFY_BACKENDS = {
+    "line": LineMessagingBackend,
+    "webhook": WebhookBackend,
+    "stub": StubBackend,
+}
+
+
+def pick_notify_backend():
+    name = NOTIFY_BACKEND
+    if not name:
+        if LINE_CHANNEL_ACCESS_TOKEN and LINE_TO:
+            name = "line"
+        elif NOTIFY_WEBHOOK_URL:
+            name = "webhook"
+    backend = NOTIFY_BACKENDS.get(name)
+    return backend() if backend else None
+
+
+class NotificationDispatcher:
+    def __init__(self, store: OrderStore, backend):
+        self.store = store
+        self.backend = backend
+        self.queue = queue.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        with store.lock:
+            store.conn.executescript(NOTIFY_OUTBOX_SCHEMA)
+        with store.transaction() as conn:
+            # ข้อความที่ค้างสถานะ sending ตอนแอปดับ → กลับไปรอส่งใหม่
+            conn.execute("UPDATE notify_outbox SET status = 'pending' WHERE status = 'sending'")
+        self.worker = threading.Thread(target=self.run, name="notify-dispatcher", daemon=True)
+        self.worker.start()
+
+    def enqueue(self, message: str):
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO notify_outbox (message, created_at) VALUES (?, ?)",
+                (message, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+        try:
+            self.queue.put_nowait(cur.lastrowid)
+        except queue.Full:
+            pass   # อยู่ใน outbox แล้ว รอบ sweep จะหยิบไปส่งเอง
+
+    def run(self):
+        last_sweep = last_prune = float("-inf")   # รอบแรกทำทันที
+        while True:
+            try:
+                wait = max(0.0, last_sweep + NOTIFY_SWEEP_INTERVAL - time.monotonic())
+                try:
+                    self.deliver(self.queue.get(timeout=wait))
+                except queue.Empty:
+                    pass
+                # sweep ตามเวลา ไม่ใช่เฉพาะตอนคิวว่าง: ช่วงออเดอร์เข้ารัว ๆ ข้อความที่รอ retry จะได้ไม่ค้าง
+                if time.monotonic() - last_sweep >= NOTIFY_SWEEP_INTERVAL:
+                    last_sweep = time.monotonic()
+                    self.sweep()
+                if time.monotonic() - last_prune >= NOTIFY_PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                print("notify dispatcher error:", e)
+
+    def sweep(self):
+        with self.store.lock:
+            due = self.store.conn.execute(
+                "SELECT id FROM notify_outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT 100",
+                (time.time(),),
+            ).fetchall()
+        for (outbox_id,) in due:
+            self.deliver(outbox_id)
+
+    def prune(self):
+        """ลบข้อความที่ส่งสำเร็จแล้วเกิน NOTIFY_SENT_KEEP_DAYS วัน (outbox จะได้ไม่โตตามยอดขาย)"""
+        cutoff = (datetime.now() - timedelta(days=NOTIFY_SENT_KEEP_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM notify_outbox WHERE status = 'sent' AND created_at < ?", (cutoff,))
+
+    @timed("notify_send")
+    def send(self, message: str):
+        self.backend.send(self.session, message)
+
+    def pending_count(self) -> int:
+        with self.store.lock:
+            return self.store.conn.execute(
+                "SELECT COUNT(*) FROM notify_outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+
+    def deliver(self, outbox_id: int):
+        # claim ก่อนส่ง กันส่งซ้ำเมื่อ id เดียวกันมาทั้งจาก queue และ sweep
+        with self.store.transaction() as conn:
+            claimed = conn.execute(
+                "UPDATE notify_outbox SET status = 'sending' "
+                "WHERE id = ? AND status = 'pending' AND next_attempt_at <= ?",
+                (outbox_id, time.time()),
+            ).rowcount
+            row = conn.execute(
+                "SELECT message, attempts FROM notify_outbox WHERE id = ?", (outbox_id,)
+            ).fetchone()
+        if not claimed or row is None:
+            return
+        message, attempts = row
+        try:
+            self.send(message)
+        except Exception as e:
+            attempts += 1
+            status = "failed" if attempts >= NOTIFY_MAX_ATTEMPTS else "pending"
+            delay = min(NOTIFY_RETRY_BASE ** attempts, NOTIFY_RETRY_MAX)
+            with self.store.transaction() as conn:
+                conn.execute(
+                    "UPDATE notify_outbox SET status = ?, attempts = ?, next_attempt_at = ?, "
+                    "last_error = ? WHERE id = ?",
+                    (status, attempts, time.time() + delay, str(e)[:500], outbox_id),
+                )
+            print("notify error:", e)
+            return
+        with self.store.transaction() as conn:
+            conn.execute(
+                "UPDATE notify_outbox SET status = 'sent', attempts = ? WHERE id = ?",
+                (attempts + 1, outbox_id),
+            )
+
+
+@st.cache_resource
+def get_notification_dispatcher():
+    backend = pick_notify_backend()
+    if backend is None:
+        return None
+    dispatcher = NotificationDispatcher(get_order_store(), backend)
+    register_gauge("notify_queue_depth", dispatcher.queue.qsize)
+    register_gauge("notify_outbox_pending", dispatcher.pending_count)
+    return dispatcher
+
+
+@timed("send_notification")
+def send_notification(message: str):
+    """ฝากข้อความแจ้งเตือนเข้า outbox แล้วคืนทันที (ไม่รอเน็ต)"""
+    dispatcher = get_notification_dispatcher()
+    if dispatcher is None:
+        return
+    dispatcher.enqueue(message)
+
+
+# ---------------- SHOP STATE ----------------
+# สถานะร้าน (เปิด/ปิด + เมนูที่หมด) ใช้ร่วมกันทุก session ของทุกคน
+# เก็บใน DB กันหายตอนรีสตาร์ท และถือค่าไว้ในหน่วยความจำให้อ่านได้ทันที
+SHOP_SETTINGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shop_settings (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class ShopState:
+    def __init__(self, store: OrderStore):
+        self.store = store
+        self.lock = threading.Lock()
+        self.version = 0   # เพิ่มทุกครั้งที่มีการเปลี่ยน ใช้ให้แต่ละ session เช็คว่าต้องรีเฟรชไหม
+        with store.lock:
+            store.conn.executescript(SHOP_SETTINGS_SCHEMA)
+            settings = dict(store.conn.execute("SELECT key, value FROM shop_settings").fetchall())
+        self.is_open = json.loads(settings.get("is_open", "true"))
+        # เมนูหมดเก็บเป็น item_id (ค่าเก่าที่เป็นชื่อเต็มแปลงให้อัตโนมัติ)
+        legacy_ids = legacy_menu_ids()
+        self.sold_out = frozenset(
+            legacy_ids.get(value, value) for value in json.loads(settings.get("sold_out", "[]"))
+        )
+
+    def update(self, **values):
+        """บันทึกค่าใหม่ลง DB แล้วเลื่อน version ให้ session อื่นรู้ว่ามีการเปลี่ยน"""
+        with self.store.transaction() as conn:
+            for key, value in values.items():
+                if isinstance(value, (set, frozenset)):
+                    value = sorted(value)
+                conn.execute(
+                    "INSERT INTO shop_settings (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (key, json.dumps(value, ensure_ascii=False)),
+                )
+        with self.lock:
+            for key, value in values.items():
+                setattr(self, key, frozenset(value) if key == "sold_out" else value)
+            self.version += 1
+
+
+@st.cache_resource
+def get_shop_state() -> ShopState:
+    return ShopState(get_order_store())
+
+
+@st.fragment(run_every=SHOP_WATCH_INTERVAL)
+def watch_shop_state():
+    """ฝั่งลูกค้า: ถ้าร้านเปลี่ยนสถานะ (เช่นปิดร้าน / เมนูหมด) ให้รีเฟรชหน้าทั้งหน้า"""
+    version = get_shop_state().version
+    if st.session_state.setdefault("shop_version", version) != version:
+        st.session_state.shop_version = version
+        st.rerun(scope="app")
+
+
+@st.fragment(run_every=ORDER_FEED_INTERVAL)
+def live_order_feed():
+    """ฝั่ง Admin: ดึงเฉพาะออเดอร์ใหม่ทุกไม่กี่วินาที (ไม่โหลดทั้งตารางใหม่)"""
+    cache = sync_orders()
+    with cache.lock:
+        total = cache.size
+        recent = cache.tail(ORDER_FEED_SIZE).iloc[::-1]
+    seen = st.session_state.setdefault("feed_seen", total)
+    if total > seen:
+        st.toast(f"🔔 มีออเดอร์ใหม่ {total - seen} รายการ")
+    st.session_state.feed_seen = total
+
+    st.subheader("🔴 ออเดอร์ล่าสุด (อัปเดตอัตโนมัติ)")
+    if recent.empty:
+        st.caption("ยังไม่มีออเดอร์")
+        return
+    recent = recent.assign(menu=recent["menu"].map(menu_labels))   # แปลงเฉพาะแถวที่โชว์
+    st.dataframe(
+        recent[["created_at", "name", "menu", "sweetness", "total_price", "status"]],
+        hide_index=True,
+    )
+
+
+@st.fragment(run_every=BARISTA_REFRESH_INTERVAL)
+def barista_queue():
+    """คิวบาริสต้า: แยกตามสถานะ กดปุ่มเดียวเลื่อนไปสถานะถัดไป"""
+    orders = get_active_orders().snapshot()
+    if not orders:
+        st.info("ไม่มีออเดอร์ค้างอยู่ 🎉")
+        return
+
+    for status in OPEN_ORDER_STATUSES:
+        queue_orders = [o for o in orders if o["status"] == status]
+        st.subheader(f"{ORDER_STATUS_LABELS[status]} ({len(queue_orders)})")
+        next_status, button_label = ORDER_STATUS_NEXT[status]
+        for order in queue_orders:
+            with st.container(border=True):
+                info_col, button_col = st.columns([3, 1])
+                with info_col:
+                    st.markdown(
+                        f"### {pickup_label(order['pickup_no'])}  \n"
+                        f"**{order['name']}** · {order['phone']} · {str(order['created_at'])[11:16]}"
+                    )
+                    for item in order["items"]:
+                        st.write(f"- {item['menu']} – {item['sweetness']}")
+                        if item["note"]:
+                            st.caption(f"  โน้ต: {item['note']}")
+                with button_col:
+                    st.button(
+                        button_label,
+                        key=f"status_{order['order_pk']}_{next_status}",
+                        on_click=set_order_status,
+                        args=(order["order_pk"], order["order_id"], status, next_status),
+                    )
 
 
 # ---------------- STATE INIT ----------------
@@ -111,16 +2214,21 @@ if "customer" not in st.session_state:
     st.session_state.customer = {}
 if "order" not in st.session_state:
     st.session_state.order = {}
-if "is_open" not in st.session_state:
-    st.session_state.is_open = True   # ค่าเริ่มต้น = เปิดร้าน
+if "cart" not in st.session_state:
+    st.session_state.cart = []
 
+shop = get_shop_state()
+# เริ่ม worker แจ้งเตือนตั้งแต่ rerun แรก → ข้อความที่ค้างใน outbox ตอนแอปดับถูกส่งต่อทันที
+get_notification_dispatcher()
+if METRICS_ENABLED and METRICS_PORT:
+    start_metrics_server()
 
 # ---------------- SIDEBAR ----------------
 st.sidebar.title("🍵Cafe")
 
 mode = st.sidebar.radio(
     "เลือกโหมด",
-    ["ลูกค้าสั่งเครื่องดื่ม", "Admin ดูออเดอร์"]
+    ["ลูกค้าสั่งเครื่องดื่ม", "บาริสต้า (คิวทำเครื่องดื่ม)", "Admin ดูออเดอร์"]
 )
 
 # -------------------------------------------------
@@ -132,9 +2240,10 @@ if mode == "ลูกค้าสั่งเครื่องดื่ม":
     st.title("🍵 ระบบรับออเดอร์มัจฉะ & เครื่องดื่มเย็น")
 
     # ---------- ตรวจสอบสถานะร้าน ----------
-    if not st.session_state.is_open:
+    watch_shop_state()
+    if not shop.is_open:
         st.error("⛔ ขณะนี้ร้านปิดรับออเดอร์แล้วค่ะ")
-        st.stop()   # ⛔ หยุดการทำงาน ไม่ไป Step ต่อ
+        stop_rerun()   # ⛔ หยุดการทำงาน ไม่ไป Step ต่อ
 
 
     st.sidebar.header("ขั้นตอนการสั่งซื้อ")
@@ -142,7 +2251,7 @@ if mode == "ลูกค้าสั่งเครื่องดื่ม":
         f"""
 - {'✅' if st.session_state.step > 1 else '👉'} **Step 1:** ลงทะเบียน  
 - {'✅' if st.session_state.step > 2 else '👉'} **Step 2:** เลือกเมนู + ความหวาน + โน้ต  
-- {'👉'} **Step 3:** ชำระเงิน
+- {'✅' if st.session_state.step > 3 else '👉'} **Step 3:** ชำระเงิน
 """
     )
 
@@ -165,55 +2274,75 @@ if mode == "ลูกค้าสั่งเครื่องดื่ม":
                 }
                 go_to_step(2)
 
-    # STEP 2 – เลือกเมนู + ความหวาน + โน้ต + สรุป
+    # STEP 2 – เลือกเมนู + ความหวาน + โน้ต ใส่ตะกร้า (สั่งได้หลายแก้ว)
     elif st.session_state.step == 2:
         st.subheader("Step 2: เลือกเมนู และระบุความหวาน")
 
         # เลือกเมนู (แยกน้ำแข็งให้ทุกออเดอร์)
         st.markdown("### 🥤 เลือกเมนูเครื่องดื่ม")
-        menu_choice = st.radio(
+        catalog = load_menu_catalog()
+        available_menu = [
+            item_id for item_id, item in catalog.items()
+            if item["available"] and item_id not in shop.sold_out
+        ]
+        if not available_menu:
+            st.error("ขออภัยค่ะ เมนูหมดทุกรายการแล้ว")
+            stop_rerun()
+        sold_out_labels = [item["label"] for item_id, item in catalog.items() if item_id not in available_menu]
+        if sold_out_labels:
+            st.caption("เมนูที่หมดแล้ว: " + ", ".join(sold_out_labels))
+        st.radio(
             "",
-            options=list(MENU_ITEMS.keys()),
-            index=0
+            options=available_menu,
+            format_func=menu_label,
+            index=0,
+            key="cart_menu",
         )
-        drink_price = MENU_ITEMS[menu_choice]
 
         # เลือกความหวาน
         st.markdown("### 🍬 เลือกระดับความหวาน")
-        sweetness = st.radio(
+        st.radio(
             "",
             options=SWEETNESS_LEVEL,
-            horizontal=True
+            horizontal=True,
+            key="cart_sweetness",
         )
 
         # ช่องโน้ตเพิ่มเติม
         st.markdown("### 📝 โน้ตเพิ่มเติม (ถ้ามี)")
-        note = st.text_area(
+        st.text_area(
             "",
             placeholder="เช่น แม่ค้าน่ารักม๊ากกก อิอิ ",
-            height=80
+            height=80,
+            key="cart_note",
         )
 
-        # คำนวณราคา
-        total_price = drink_price
+        st.button("➕ ใส่ตะกร้า", on_click=add_to_cart)
 
-        # สรุป
+        # สรุปตะกร้า
         st.markdown("---")
-        st.markdown("### 📋 สรุปรายการที่เลือก")
+        st.markdown("### 🛒 ตะกร้าของคุณ")
+
+        cart = st.session_state.cart
+        if not cart:
+            st.info("ยังไม่มีเครื่องดื่มในตะกร้า เลือกเมนูแล้วกด \"ใส่ตะกร้า\" ได้เลยค่ะ")
+        for i, item in enumerate(cart):
+            item_col, remove_col = st.columns([5, 1])
+            with item_col:
+                st.write(f"{i + 1}. **{item['menu']}** – {item['sweetness']}")
+                if item["note"]:
+                    st.caption(f"โน้ต: {item['note']}")
+            with remove_col:
+                st.button("ลบ", key=f"cart_remove_{i}", on_click=remove_from_cart, args=(i,))
 
-        st.write(f"**เมนู:** {menu_choice}")
-        st.write(f"**ความหวาน:** {sweetness}")
-        if note.strip():
-            st.write(f"**โน้ตเพิ่มเติม:** {note.strip()}")
-        else:
-            st.write("**โน้ตเพิ่มเติม:** -")
-        st.write(f"**ยอดรวมทั้งหมด:** 💸 {total_price} บาท")
+        # คำนวณราคา
+        drink_price = sum(item["price"] for item in cart)
+        total_price = drink_price
+        st.write(f"**ยอดรวมทั้งหมด:** 💸 {total_price} บาท ({len(cart)} แก้ว)")
 
         # เก็บค่าลง session
         st.session_state.order = {
-            "menu": menu_choice,
-            "sweetness": sweetness,
-            "note": note.strip(),
+            "items": list(cart),
             "price": drink_price,
             "delivery_fee": DELIVERY_FEE,
             "total_price": total_price,
@@ -226,7 +2355,10 @@ if mode == "ลูกค้าสั่งเครื่องดื่ม":
                 go_to_step(1)
         with col2:
             if st.button("ไป Step 3 – ชำระเงิน ➡️"):
-                go_to_step(3)
+                if not cart:
+                    st.error("กรุณาใส่เครื่องดื่มลงตะกร้าอย่างน้อย 1 แก้วค่ะ")
+                else:
+                    go_to_step(3)
 
     # STEP 3 – ชำระเงิน + แนบสลิป
     elif st.session_state.step == 3:
@@ -241,17 +2373,14 @@ if mode == "ลูกค้าสั่งเครื่องดื่ม":
 
         st.markdown("### 🥤 รายการที่สั่ง")
 
+        items = order.get("items", [])
         drink_price = order.get("price", 0)
         delivery_fee = order.get("delivery_fee", 0)
         total_price = order.get("total_price", drink_price + delivery_fee)
 
-        st.write(f"**เมนู:** {order.get('menu', '-')}")
-        st.write(f"**ความหวาน:** {order.get('sweetness', '-')}")
-        if order.get("note", ""):
-            st.write(f"**โน้ตเพิ่มเติม:** {order.get('note')}")
-        else:
-            st.write("**โน้ตเพิ่มเติม:** -")
-
+        for i, item in enumerate(items, 1):
+            st.write(f"{i}. **{item['menu']}** – {item['sweetness']} ({item['price']} บาท)")
+            st.caption(f"โน้ตเพิ่มเติม: {item['note'] or '-'}")
 
         st.write(f"**ยอดรวมทั้งหมด:** 💸 {total_price} บาท")
 
@@ -276,162 +2405,254 @@ if mode == "ลูกค้าสั่งเครื่องดื่ม":
         if confirm_btn:
             if slip_file is None:
                 st.error("กรุณาอัปโหลดสลิปโอนเงินก่อนกดยืนยันออเดอร์นะคะ")
+            elif not items:
+                st.error("ตะกร้าว่าง กรุณากลับไปเลือกเมนูก่อนนะคะ")
+            elif any(item["item_id"] in shop.sold_out for item in items):
+                st.error("ขออภัยค่ะ มีเมนูในตะกร้าที่เพิ่งหมด กรุณากลับไปแก้ตะกร้า")
             else:
-                # เซฟไฟล์สลิป
-                ext = os.path.splitext(slip_file.name)[1].lower()
-                if ext == "":
-                    ext = ".jpg"
-                slip_name = f"slip_{uuid.uuid4().hex}{ext}"
-                slip_path = os.path.join(SLIPS_DIR, slip_name)
-                with open(slip_path, "wb") as f:
-                    f.write(slip_file.getbuffer())
-
-                # สร้าง order_id รวมชื่อ + เบอร์ + เวลา
+                # เซฟไฟล์สลิป (ย่อรูป + ตั้งชื่อตาม hash)
+                try:
+                    slip_name = ingest_slip(slip_file)
+                except ValueError as e:
+                    st.error(str(e))
+                    stop_rerun()
+                used_by = find_order_by_slip(slip_name)
+                if used_by:
+                    st.error(f"สลิปนี้ถูกใช้กับออเดอร์ {used_by} ไปแล้ว กรุณาแนบสลิปของออเดอร์นี้ค่ะ")
+                    stop_rerun()
+
+                # บันทึกข้อมูลออเดอร์ (order_id / เลขคิว ออกให้ตอนบันทึก)
                 now = datetime.now()
-                clean_name = customer.get("name", "").strip().replace(" ", "").lower()
-                clean_phone = customer.get("phone", "").strip()
-                timestamp = now.strftime("%Y%m%d%H%M%S")
-                order_id = f"{clean_name}-{clean_phone}-{timestamp}"
-
-                # บันทึกข้อมูลออเดอร์
                 order_data = {
-                    "order_id": order_id,
                     "created_at": now.strftime("%Y-%m-%d %H:%M:%S"),
                     "name": customer.get("name", ""),
                     "phone": customer.get("phone", ""),
-                    "menu": order.get("menu", ""),
-                    "sweetness": order.get("sweetness", ""),
-                    "note": order.get("note", ""),
                     "price": drink_price,
                     "delivery_fee": delivery_fee,
                     "total_price": total_price,
                     "slip_file": slip_name,
                 }
-                save_order(order_data)
+                saved = save_order(order_data, items)
+                order_id, pickup = saved["order_id"], pickup_label(saved["pickup_no"])
 
-                # แจ้งเตือน LINE (ถ้าตั้ง token ไว้)
+                # แจ้งเตือนร้าน (ถ้าตั้งค่าไว้) – ส่งเบื้องหลัง ไม่ต้องรอ
                 try:
+                    item_lines = "\n".join(
+                        f"{i}. {item['menu']} / {item['sweetness']}"
+                        + (f" / โน้ต: {item['note']}" if item["note"] else "")
+                        for i, item in enumerate(items, 1)
+                    )
                     msg = (
-                        "📦 มีออเดอร์มัจฉะใหม่!\n"
+                        f"📦 มีออเดอร์มัจฉะใหม่! คิว {pickup}\n"
                         f"ID: {order_id}\n"
                         f"ลูกค้า: {customer.get('name', '')}\n"
                         f"เบอร์: {customer.get('phone', '')}\n"
-                        f"เมนู: {order.get('menu', '')}\n"
-                        f"ความหวาน: {order.get('sweetness', '')}\n"
-                        f"โน้ต: {order.get('note', '-')}\n"
+                        f"รายการ ({len(items)} แก้ว):\n{item_lines}\n"
                         f"ราคาเครื่องดื่ม: {drink_price} บาท\n"
                         f"ค่าจัดส่ง: {delivery_fee} บาท\n"
                         f"ยอดรวมทั้งหมด: {total_price} บาท"
                     )
-                    send_line_notify(msg)
+                    send_notification(msg)
                 except Exception:
                     pass
 
-                st.success(f"🎉 รับออเดอร์เรียบร้อยแล้ว! (Order ID: {order_id})")
-                st.info("กรุณารอเรียกชื่อเมื่อเครื่องดื่มของคุณพร้อมเสิร์ฟนะคะ 🍵")
+                # ล้างตะกร้าทันทีที่บันทึกแล้ว กดยืนยันซ้ำจะไม่บันทึกออเดอร์เดิมอีกรอบ
+                st.session_state.placed_order = {"order_id": order_id, "pickup": pickup}
+                st.session_state.order = {}
+                st.session_state.cart = []
+                go_to_step(4)
+                st.rerun()
+
+    # STEP 4 – บันทึกออเดอร์แล้ว
+    elif st.session_state.step == 4:
+        placed = st.session_state.get("placed_order", {})
+        st.success(f"🎉 รับออเดอร์เรียบร้อยแล้ว! เลขคิวของคุณคือ {placed.get('pickup', '-')}")
+        st.caption(f"Order ID: {placed.get('order_id', '-')}")
+        st.info("กรุณารอเรียกเลขคิว / ชื่อเมื่อเครื่องดื่มของคุณพร้อมเสิร์ฟนะคะ 🍵")
+        st.button("เริ่มออเดอร์ใหม่ 🆕", on_click=start_new_order)
+
+# -------------------------------------------------
+#                 BARISTA MODE
+# -------------------------------------------------
+elif mode == "บาริสต้า (คิวทำเครื่องดื่ม)":
+    st.title("☕ คิวทำเครื่องดื่ม")
+
+    password = st.text_input("กรุณาใส่รหัสผ่าน", type="password")
+
+    if password != ADMIN_PASSWORD:
+        st.warning("รหัสผ่านไม่ถูกต้องหรือยังไม่ได้กรอก")
+        stop_rerun()
 
-                if st.button("เริ่มออเดอร์ใหม่ 🆕"):
-                    st.session_state.step = 1
-                    st.session_state.customer = {}
-                    st.session_state.order = {}
+    barista_queue()
 
 # -------------------------------------------------
 #                 ADMIN MODE
 # -------------------------------------------------
 else:
     st.title("🛠 Admin Login")
-        # ปุ่มสลับเปิด/ปิดร้าน
-    st.markdown("### 🔧 สถานะร้าน")
-    if st.session_state.is_open:
-        st.success("ร้าน: เปิดรับออเดอร์อยู่")
-        if st.button("⛔ ปิดรับออเดอร์"):
-            st.session_state.is_open = False
-    else:
-        st.error("ร้าน: ปิดรับออเดอร์")
-        if st.button("✅ เปิดรับออเดอร์"):
-            st.session_state.is_open = True
-
 
     password = st.text_input("กรุณาใส่รหัสผ่านเพื่อเข้าหน้า Admin", type="password")
 
-    if password != "goggag1112":
+    if password != ADMIN_PASSWORD:
         st.warning("รหัสผ่านไม่ถูกต้องหรือยังไม่ได้กรอก")
-        st.stop()
+        stop_rerun()
     else:
         st.success("เข้าสู่ระบบสำเร็จ ✔️")
+
+        # ปุ่มสลับเปิด/ปิดร้าน (มีผลกับลูกค้าทุกคน จึงต้องล็อกอินก่อน)
+        st.markdown("### 🔧 สถานะร้าน")
+        if shop.is_open:
+            st.success("ร้าน: เปิดรับออเดอร์อยู่")
+            if st.button("⛔ ปิดรับออเดอร์"):
+                shop.update(is_open=False)
+                st.rerun()
+        else:
+            st.error("ร้าน: ปิดรับออเดอร์")
+            if st.button("✅ เปิดรับออเดอร์"):
+                shop.update(is_open=True)
+                st.rerun()
+
+        sold_out = st.multiselect(
+            "เมนูที่หมดแล้ว (ลูกค้าจะเลือกไม่ได้)",
+            options=list(load_menu_catalog()),
+            format_func=menu_label,
+            default=[item_id for item_id in load_menu_catalog() if item_id in shop.sold_out],
+        )
+        if set(sold_out) != shop.sold_out:
+            shop.update(sold_out=sold_out)
+
+        admin_page = st.radio("หน้า", ["📦 ออเดอร์", "📊 ยอดขาย", "🗄️ คลัง", "🩺 ระบบ"], horizontal=True)
+        if admin_page == "📊 ยอดขาย":
+            st.title("📊 Admin – ยอดขาย")
+            show_sales_dashboard()
+            stop_rerun()
+        if admin_page == "🗄️ คลัง":
+            st.title("🗄️ Admin – คลังออเดอร์เก่า")
+            show_archive_page()
+            stop_rerun()
+        if admin_page == "🩺 ระบบ":
+            st.title("🩺 Admin – สุขภาพระบบ")
+            show_system_health()
+            stop_rerun()
+
         st.title("📦 Admin – จัดการออเดอร์")
 
+        live_order_feed()
+
         df = load_orders()
 
         if df.empty:
             st.info("ยังไม่มีออเดอร์เข้ามาในระบบ")
         else:
-            st.subheader("ลิสต์ออเดอร์ทั้งหมด")
-            st.dataframe(df)
+            st.subheader("ลิสต์ออเดอร์")
+
+            filter_col1, filter_col2 = st.columns(2)
+            with filter_col1:
+                today_only = st.checkbox("เฉพาะวันนี้", value=True)
+                status_filter = st.multiselect(
+                    "สถานะ",
+                    options=list(ORDER_STATUS_LABELS),
+                    format_func=lambda s: ORDER_STATUS_LABELS.get(s, s),
+                )
+            with filter_col2:
+                pending_slip_only = st.checkbox("เฉพาะที่ยังไม่แนบสลิป")
+                menu_filter = st.multiselect(
+                    "เมนู", options=list(load_menu_catalog()), format_func=menu_label
+                )
+
+            filtered = filter_orders(today_only, status_filter, menu_filter, pending_slip_only)
+
+            # สรุปยอดด้วยการ aggregate แทนการส่งทั้งตารางไปแสดง
+            metric_col1, metric_col2, metric_col3 = st.columns(3)
+            metric_col1.metric("จำนวนออเดอร์", f"{len(filtered):,}")
+            metric_col2.metric("ยอดขายรวม", f"{int(filtered['total_price'].sum()):,} บาท")
+            metric_col3.metric("ค่าจัดส่งรวม", f"{int(filtered['delivery_fee'].sum()):,} บาท")
+
+            page_col1, page_col2 = st.columns(2)
+            with page_col1:
+                page_size = st.selectbox("แถวต่อหน้า", ORDER_PAGE_SIZES)
+            page_count = max(1, -(-len(filtered) // page_size))
+            with page_col2:
+                page = st.number_input("หน้า", min_value=1, max_value=page_count, value=1, step=1)
+            start = (int(page) - 1) * page_size
+            page_rows = filtered.iloc[start:start + page_size]
+            st.dataframe(page_rows.assign(menu=page_rows["menu"].map(menu_labels)), hide_index=True)
+            st.caption(f"หน้า {int(page)} / {page_count}")
 
             st.markdown("---")
             st.subheader("🧾 ดู / พิมพ์ Slip")
 
-            order_ids = df["order_id"].astype(str).tolist()
-            selected_id = st.selectbox("เลือก Order ID", order_ids)
-
-            if selected_id:
-                row = df[df["order_id"].astype(str) == selected_id].iloc[0]
+            search_col, date_col = st.columns(2)
+            with search_col:
+                query = st.text_input(
+                    "ค้นหาชื่อ / เบอร์โทร / Order ID / เลขคิว",
+                    placeholder="เช่น กิ๊ฟ, 0812 หรือ #012",
+                )
+            with date_col:
+                today = datetime.now().date()
+                date_range = st.date_input(
+                    "ช่วงวันที่",
+                    value=(today - timedelta(days=7), today),
+                )
+            if isinstance(date_range, (list, tuple)) and len(date_range) == 2:
+                date_from, date_to = date_range
+            else:
+                date_from = date_to = None
+
+            order_ids = search_orders(query, date_from, date_to)
+            if len(order_ids) >= MAX_ORDER_OPTIONS:
+                st.caption(f"แสดง {MAX_ORDER_OPTIONS} รายการล่าสุด ลองค้นหาให้แคบลงค่ะ")
+            selected_id = st.selectbox("เลือกออเดอร์", order_ids, format_func=order_option_label)
+
+            row = get_order_row(selected_id) if selected_id else None
+            if row is None and selected_id:
+                st.warning("ไม่พบออเดอร์นี้")
+            if row is not None:
+
+                items = load_order_items(row["order_id"])
+                items_md = "\n".join(
+                    f"- {item['menu']} – {item['sweetness']}"
+                    + (f" (โน้ต: {item['note']})" if item["note"] else "")
+                    for item in items
+                )
 
                 st.markdown("### ตัวอย่าง Slip สำหรับปริ้น")
                 st.markdown(
                     f"""
 **ใบรับออเดอร์**
 
+- เลขคิว: **{pickup_label(row['pickup_no'])}**
 - Order ID: `{row['order_id']}`
 - วันที่: {row['created_at']}
 - ชื่อลูกค้า: {row['name']}
 - เบอร์โทร: {row['phone']}
 
-**รายการเครื่องดื่ม**
+**รายการเครื่องดื่ม ({len(items)} แก้ว)**
+
+{items_md}
 
-- เมนู: {row['menu']}
-- ความหวาน: {row['sweetness']}
-- โน้ตเพิ่มเติม: {row.get('note', '')}
-- ยอดรวมทั้งหมด: {row.get('total_price', 0)} บาท
+**ยอดรวมทั้งหมด:** {row.get('total_price', 0)} บาท
 """
                 )
 
                 slip_file = row.get("slip_file", None)
                 if isinstance(slip_file, str):
-                    slip_path = os.path.join(SLIPS_DIR, slip_file)
-                    if os.path.exists(slip_path):
+                    slip_image = load_slip_image(slip_file)
+                    if slip_image is not None:
                         st.markdown("**สลิปโอนเงิน (จากลูกค้า):**")
-                        st.image(slip_path, use_column_width=True)
+                        if st.toggle("ดูรูปเต็ม", key=f"slip_full_{selected_id}"):
+                            st.image(load_slip_image(slip_file, full_size=True), width="stretch")
+                        else:
+                            st.image(slip_image)
                     else:
                         st.warning("ไม่พบไฟล์สลิปที่บันทึกไว้")
 
                 # สร้าง HTML สำหรับดาวน์โหลดไปปริ้น
-                slip_html = f"""
-<html>
-  <head>
-    <meta charset="utf-8" />
-    <title>Order {row['order_id']}</title>
-  </head>
-  <body style="font-family: sans-serif; max-width: 400px; margin: 0 auto;">
-    <h2>ใบรับออเดอร์</h2>
-    <p><strong>Order ID:</strong> {row['order_id']}<br/>
-       <strong>วันที่:</strong> {row['created_at']}<br/>
-       <strong>ชื่อลูกค้า:</strong> {row['name']}<br/>
-       <strong>เบอร์โทร:</strong> {row['phone']}</p>
-    <hr/>
-    <h3>รายการเครื่องดื่ม</h3>
-    <p>
-       เมนู: {row['menu']}<br/>
-       ความหวาน: {row['sweetness']}<br/>
-       โน้ตเพิ่มเติม: {row.get('note', '')}<br/>
-       ยอดรวมทั้งหมด: {row.get('total_price', 0)} บาท
-    </p>
-    <hr/>
-    <p style="text-align:center;">ขี้เกียจมาก แต่ลูกค้าอยากกิงอีก จัดไปฮะๆ อิอิ🩷❤️🩵💙💜💖</p>
-  </body>
-</html>
-"""
+                slip_html = (
+                    RECEIPT_PAGE_HEAD.substitute(title=html.escape(f"Order {row['order_id']}"))
+                    + render_receipt(row, items)
+                    + RECEIPT_PAGE_TAIL
+                )
                 slip_bytes = slip_html.encode("utf-8")
 
                 st.download_button(
@@ -440,3 +2661,29 @@ else:
                     file_name=f"order_{row['order_id']}.html",
                     mime="text/html"
                 )
+
+            st.markdown("---")
+            st.subheader("🖨️ พิมพ์ใบรับออเดอร์ทั้งช่วงวันที่")
+
+            today = datetime.now().date()
+            export_range = st.date_input("ช่วงวันที่ที่จะพิมพ์", value=(today, today), key="export_range")
+            if isinstance(export_range, (list, tuple)) and len(export_range) == 2:
+                export_from, export_to = export_range
+                export_col1, export_col2 = st.columns(2)
+                with export_col1:
+                    # ส่ง callable → สร้างไฟล์ตอนกดปุ่มเท่านั้น
+                    st.download_button(
+                        "⬇️ ใบรับออเดอร์ทั้งหมด (HTML)",
+                        data=functools.partial(export_receipts_html, export_from, export_to),
+                        file_name=f"orders_{export_from}_{export_to}.html",
+                        mime="text/html",
+                    )
+                with export_col2:
+                    st.download_button(
+                        "⬇️ รูปสลิปทั้งหมด (ZIP)",
+                        data=functools.partial(export_slips_zip, export_from, export_to),
+                        file_name=f"slips_{export_from}_{export_to}.zip",
+                        mime="application/zip",
+                    )
+
+finish_rerun()
@@ -0,0 +1,302 @@
+"""Benchmark การรับออเดอร์ของ app.py ช่วงคนเยอะ (ใช้เป็น baseline ก่อนแก้ storage / notification)
+
+วัด 2 ส่วน:
+1. flow ลูกค้า Step 1 → 2 → 3 ผ่าน Streamlit AppTest แบบ headless
+   ลูกค้าจำลองหลายคนพร้อมกัน + อัปโหลดสลิปสังเคราะห์ + เซิร์ฟเวอร์ webhook ปลอม
+   (AppTest รันพร้อมกันหลาย thread ไม่ได้ จึงแยกลูกค้าแต่ละคนเป็นคนละ process
+   ใช้ orders.db ไฟล์เดียวกัน เหมือนเปิดแอปหลาย process)
+   → latency ตอนกดยืนยันออเดอร์ (p50 / p99)
+2. storage ที่จำนวนออเดอร์ 1k / 10k / 100k แถว
+   → เวลา save_order, load_orders (ครั้งแรก / จาก cache / หลังมีออเดอร์ใหม่) และหน่วยความจำ
+
+ทุกอย่างรันในโฟลเดอร์ชั่วคราว ไม่แตะ orders.db / slips จริง
+
+    python bench/bench_order_flow.py
+    python bench/bench_order_flow.py --customers 20 --orders 100 --rows 1000 10000 100000
+"""
+import argparse
+import io
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(REPO_DIR, "app.py")
+ASSETS = ["qr_matcha.jpeg"]
+
+
+# ---------------- STUB NOTIFY SERVER ----------------
+class StubNotifyHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay)
+        with self.lock:
+            StubNotifyHandler.received += 1
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(delay: float) -> ThreadingHTTPServer:
+    StubNotifyHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubNotifyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ---------------- HELPERS ----------------
+def percentile(values, pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def fmt_ms(seconds: float) -> str:
+    return f"{seconds * 1000:9.2f} ms"
+
+
+def synthetic_slip(seed: int) -> bytes:
+    """รูปสลิปปลอมขนาดประมาณรูปจากมือถือ (สีต่างกันทุกใบ กันโดนจับว่าใช้สลิปซ้ำ)"""
+    rng = random.Random(seed)
+    img = Image.new("RGB", (1080, 1920), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    img.putpixel((rng.randrange(1080), rng.randrange(1920)), (seed % 256, seed // 256 % 256, 7))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def prepare_workdir(root: str, name: str) -> str:
+    workdir = os.path.join(root, name)
+    os.makedirs(workdir)
+    for asset in ASSETS:
+        src = os.path.join(REPO_DIR, asset)
+        if os.path.exists(src):
+            shutil.copy(src, workdir)
+    return workdir
+
+
+# ---------------- ORDER FLOW ----------------
+def check_run(at, seq: int, step: str):
+    """แอปพังระหว่างรันให้แจ้ง error ของแอปเลย (ไม่งั้นจะไปพังตอนหาปุ่ม/ช่องกรอกแทน)"""
+    if at.exception:
+        raise RuntimeError(f"order {seq} crashed at {step}: {at.exception[0].message}")
+
+
+def place_order(seq: int, secrets: dict) -> float:
+    """ลูกค้า 1 คนสั่ง 1 ออเดอร์ตั้งแต่ Step 1 ถึงกดยืนยัน คืนเวลาที่ใช้ตอนกดยืนยัน"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_FILE, default_timeout=120)
+    at.secrets.update(secrets)
+    at.run()
+    check_run(at, seq, "start")
+
+    # Step 1
+    at.text_input[0].set_value(f"ลูกค้า{seq}")
+    at.text_input[1].set_value(f"08{seq:08d}")
+    at.button[0].click().run()
+    check_run(at, seq, "step 1")
+    at.run()
+    check_run(at, seq, "step 1")
+
+    # Step 2 – ใส่ตะกร้า 1-3 แก้ว
+    for _ in range(1 + seq % 3):
+        next(b for b in at.button if b.label == "➕ ใส่ตะกร้า").click().run()
+        check_run(at, seq, "step 2 add to cart")
+    next(b for b in at.button if b.label.startswith("ไป Step 3")).click().run()
+    check_run(at, seq, "step 2")
+    at.run()
+    check_run(at, seq, "step 2")
+
+    # Step 3 – แนบสลิปแล้วยืนยัน
+    at.file_uploader[0].set_value((f"slip_{seq}.jpg", synthetic_slip(seq), "image/jpeg"))
+    at.run()
+    check_run(at, seq, "step 3 upload")
+    confirm = next(b for b in at.button if b.label == "✅ ยืนยันออเดอร์")
+    started = time.perf_counter()
+    confirm.click().run()
+    elapsed = time.perf_counter() - started
+    check_run(at, seq, "confirm")
+
+    if not at.success:
+        raise RuntimeError(f"order {seq} failed: {[e.value for e in at.error]}")
+    return elapsed
+
+
+def bench_order_flow(root: str, customers: int, orders: int, notify_delay: float, report):
+    server = start_stub_server(notify_delay)
+    secrets = {
+        "NOTIFY_BACKEND": "webhook",
+        "NOTIFY_WEBHOOK_URL": f"http://127.0.0.1:{server.server_port}/notify",
+    }
+    workdir = prepare_workdir(root, "flow")
+    os.chdir(workdir)
+
+    # AppTest แทนที่ __main__ ใน process ลูก → ต้องส่งฟังก์ชันผ่านชื่อโมดูลจริงแทน __main__
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_order_flow import place_order as worker
+
+    with ProcessPoolExecutor(max_workers=customers, initializer=os.chdir, initargs=(workdir,)) as pool:
+        started = time.perf_counter()
+        latencies = list(pool.map(worker, range(1, orders + 1), [secrets] * orders))
+        wall = time.perf_counter() - started
+
+        # รอ dispatcher ของแต่ละ process ส่งแจ้งเตือนที่ค้างให้หมด (ไม่นับรวมใน latency)
+        deadline = time.time() + 60
+        while StubNotifyHandler.received < orders and time.time() < deadline:
+            time.sleep(0.1)
+    server.shutdown()
+
+    slips_bytes = sum(
+        os.path.getsize(os.path.join(dirpath, name))
+        for dirpath, _, names in os.walk("slips") for name in names
+    )
+    report(f"== order flow: {orders} orders, {customers} concurrent customers, notify delay {notify_delay}s ==")
+    report(f"confirm p50        {fmt_ms(percentile(latencies, 50))}")
+    report(f"confirm p99        {fmt_ms(percentile(latencies, 99))}")
+    report(f"confirm max        {fmt_ms(max(latencies))}")
+    report(f"throughput         {orders / wall:9.2f} orders/s")
+    report(f"notifications      {StubNotifyHandler.received} / {orders}")
+    report(f"slips on disk      {slips_bytes / 1024:9.1f} KiB")
+
+
+# ---------------- STORAGE ----------------
+def seed_orders(app, store, rows: int):
+    """ใส่ออเดอร์ปลอมตรง ๆ ลง DB (เร็วกว่าเรียก save_order ทีละแถว)"""
+    item_ids = list(app.load_menu_catalog())
+    base = time.time() - rows * 60
+    generator = app.OrderIdGenerator()
+    with store.transaction() as conn:
+        for start in range(0, rows, 10_000):
+            batch = []
+            for n in range(start, min(rows, start + 10_000)):
+                created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(base + n * 60))
+                batch.append({
+                    "order_id": generator.new((base + n * 60) * 1000), "pickup_no": n % 1440 + 1,
+                    "created_at": created_at, "name": f"ลูกค้า{n % 500}",
+                    "phone": f"08{n % 500:08d}", "menu": item_ids[n % len(item_ids)],
+                    "sweetness": app.SWEETNESS_LEVEL[n % 3], "note": "", "price": 50,
+                    "delivery_fee": app.DELIVERY_FEE, "total_price": 50, "slip_file": "",
+                    "status": "picked_up",
+                })
+            cur = conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders")
+            first_pk = cur.fetchone()[0] + 1
+            conn.executemany(
+                f"INSERT INTO orders ({', '.join(app.ORDER_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in app.ORDER_COLUMNS)})",
+                [[order.get(col) for col in app.ORDER_COLUMNS] for order in batch],
+            )
+            conn.executemany(
+                "INSERT INTO order_items (order_pk, line_no, item_id, sweetness, note, price) "
+                "VALUES (?, 1, ?, ?, '', 50)",
+                [(first_pk + i, order["menu"], order["sweetness"]) for i, order in enumerate(batch)],
+            )
+    app.rebuild_rollups(store)
+
+
+def reset_app_caches(app):
+    for name in ("get_order_store", "get_order_cache", "get_active_orders", "get_shop_state"):
+        getattr(app, name).clear()
+
+
+def bench_storage(root: str, sizes, report):
+    os.chdir(prepare_workdir(root, "import"))
+    sys.path.insert(0, REPO_DIR)
+    import app  # รันหน้าแรกของแอปแบบ bare mode ครั้งเดียว เพื่อใช้ฟังก์ชันข้างใน
+
+    report("== storage ==")
+    report(f"{'rows':>8} {'save_order':>12} {'load cold':>12} {'load warm':>12} {'load +1 row':>12} {'cold peak':>10}")
+    for rows in sizes:
+        os.chdir(prepare_workdir(root, f"rows_{rows}"))
+        reset_app_caches(app)
+        seed_orders(app, app.get_order_store(), rows)
+        reset_app_caches(app)
+
+        started = time.perf_counter()
+        app.load_orders()
+        load_cold = time.perf_counter() - started
+
+        # วัดหน่วยความจำแยกอีกรอบ (tracemalloc ทำให้ช้าลงมาก ไม่ใช้ตอนจับเวลา)
+        app.get_order_cache.clear()
+        tracemalloc.start()
+        app.load_orders()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        app.load_orders()
+        load_warm = time.perf_counter() - started
+
+        save_times = []
+        for n in range(50):
+            order = {
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "name": "bench", "phone": "0800000000", "price": 50,
+                "delivery_fee": app.DELIVERY_FEE, "total_price": 50, "slip_file": "",
+            }
+            items = [{"item_id": "cocoa-cup", "menu": "", "sweetness": "หวานน้อย", "note": "", "price": 50}]
+            started = time.perf_counter()
+            app.save_order(order, items)
+            save_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        app.load_orders()
+        load_incremental = time.perf_counter() - started
+
+        report(
+            f"{rows:>8} {fmt_ms(percentile(save_times, 50)):>12} {fmt_ms(load_cold):>12} "
+            f"{fmt_ms(load_warm):>12} {fmt_ms(load_incremental):>12} {peak / 2**20:8.1f} MB"
+        )
+    report(f"max RSS            {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:9.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=10, help="จำนวนลูกค้าที่สั่งพร้อมกัน")
+    parser.add_argument("--orders", type=int, default=50, help="จำนวนออเดอร์ทั้งหมดใน flow test")
+    parser.add_argument("--notify-delay", type=float, default=1.0, help="ความหน่วงของ webhook ปลอม (วินาที)")
+    parser.add_argument("--rows", type=int, nargs="*", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--skip-flow", action="store_true")
+    parser.add_argument("--output", default=os.path.join(REPO_DIR, "bench_output.txt"))
+    args = parser.parse_args()
+
+    lines = []
+
+    def report(line: str):
+        print(line, flush=True)
+        lines.append(line)
+
+    root = tempfile.mkdtemp(prefix="matcha-bench-")
+    cwd = os.getcwd()
+    try:
+        if not args.skip_flow:
+            bench_order_flow(root, args.customers, args.orders, args.notify_delay, report)
+        if args.rows:
+            bench_storage(root, args.rows, report)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()